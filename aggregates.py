@@ -0,0 +1,55 @@
+import numpy as np
+
+from filter_index import ALL
+from frame_cache import IdentityLRU
+
+# Khối tổng hợp gốc theo (bảng, chiều): thường chỉ vài trăm dòng
+CUBE_CACHE_SIZE = 16
+# Kết quả đã cắt theo trạng thái bộ lọc, dùng lại khi rerun chỉ đổi bố cục (kéo slider...)
+RESULT_CACHE_SIZE = 256
+
+_cube_cache = IdentityLRU(CUBE_CACHE_SIZE, "aggregate_cube")
+_result_cache = IdentityLRU(RESULT_CACHE_SIZE, "aggregate")
+
+
+def get_cube(df, dims, value=None):
+    dims = tuple(dims)
+    key = (dims, value)
+    cube = _cube_cache.get(key, df)
+    if cube is not None:
+        return cube
+
+    # Giữ cả nhóm có giá trị thiếu để khi bộ lọc là "Tất cả" không làm rơi dòng
+    grouped = df.groupby(list(dims), dropna=False, observed=True, sort=False)
+    cube = grouped.size().rename("count").to_frame()
+    if value is not None:
+        cube[value] = grouped[value].sum()
+    cube = cube.reset_index()
+
+    return _cube_cache.put(key, cube, df)
+
+
+def aggregate(df, by, selections=None, value=None):
+    # Kết quả giống df[bộ lọc].groupby(by).size().reset_index(name='count'),
+    # hoặc .groupby(by)[value].sum().reset_index() khi có value
+    by = tuple(by)
+    active = {
+        col: selected
+        for col, selected in (selections or {}).items()
+        if selected is not None and selected != ALL
+    }
+    key = (by, tuple(sorted(active.items())), value)
+    result = _result_cache.get(key, df)
+    if result is not None:
+        return result
+
+    dims = by + tuple(col for col in sorted(active) if col not in by)
+    cube = get_cube(df, dims, value)
+    mask = np.ones(len(cube), dtype=bool)
+    for col, selected in active.items():
+        mask &= (cube[col] == selected).to_numpy()
+
+    measure = value if value is not None else "count"
+    result = cube[mask].groupby(list(by), observed=True)[measure].sum().reset_index()
+
+    return _result_cache.put(key, result, df)
@@ -1,22 +1,37 @@
 import streamlit as st
-from trade_map import main as powerplant_main
-from retail_map import main as retail_map_main
-from banking_map import main as banking_map_main
-from industry_map import main as industry_map_main
+from data_loader import warmup_status
+from debug_panel import render_debug_panel
+from instrumentation import configure, finish_run, start_run
+from page_registry import PAGES, import_times, load_page
+from refresher import start_refresher
+from search_box import render_search_box
 
 st.set_page_config(page_title="Ứng dụng Nhà máy điện & Bán lẻ", layout="wide")
 
 menu_option = st.sidebar.radio(
     "Chọn loại hình:",
-    options=["Nhà máy điện", "Bán lẻ", "Ngân hàng", "Khu công nghiệp"],
+    options=list(PAGES),
     key="menu_option"
 )
 
-if menu_option == "Nhà máy điện":
-    powerplant_main()
-elif menu_option == "Bán lẻ":
-    retail_map_main()
-elif menu_option == "Khu công nghiệp":
-    industry_map_main()
-else:
-    banking_map_main()
+# Log hiệu năng và đo bộ nhớ cấu hình theo tiến trình (PERF_LOG_LEVEL, PERF_TRACE_MEMORY)
+configure()
+
+# Luồng nền: lượt đầu dựng song song mọi bảng, sau đó theo dõi các file CSV và công bố phiên bản mới.
+# Trang chỉ chờ đúng bảng mình cần khi bảng đó còn đang được dựng
+start_refresher()
+warming = [name for name, state in warmup_status().items() if state == "warming"]
+if warming:
+    st.sidebar.caption("⏳ Đang chuẩn bị dữ liệu: " + ", ".join(warming))
+
+# Chỉ import module của trang đang xem (trang khác nạp khi được chọn lần đầu)
+page_main = load_page(menu_option)
+
+with st.sidebar.expander("⏱️ Thời gian nạp trang"):
+    for module_name, seconds in import_times().items():
+        st.write(f"{module_name}: {seconds * 1000:.0f} ms")
+
+start_run(menu_option)
+render_search_box()
+page_main()
+render_debug_panel(finish_run())
@@ -1,38 +1,13 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import os
-
-# MAP4D_API_KEY = os.getenv("MAP4D_API_KEY")
-# MAP4D_MAP_ID = os.getenv("MAP4D_MAP_ID", "")
-
-MAP4D_API_KEY = st.secrets.get("MAP4D_API_KEY") or os.getenv("MAP4D_API_KEY")
-MAP4D_MAP_ID = st.secrets.get("MAP4D_MAP_ID") or os.getenv("MAP4D_MAP_ID", "")
-
-def render_map4d(df, api_key, map_id=""):
-    template_path = os.path.join(os.path.dirname(__file__), "map4d_template.html")
-    if not os.path.exists(template_path):
-        st.error("❌ Không tìm thấy file map4d_template.html!")
-        return
-
-    with open(template_path, "r", encoding="utf-8") as f:
-        html_template = f.read()
-
-    marker_js = ""
-    for _, row in df.iterrows():
-        marker_js += f"""
-        new map4d.Marker({{
-            position: {{ lat: {row['latitude']}, lng: {row['longitude']} }},
-            title: "{row['name']}"
-        }}).setMap(map);
-        """
-    html_content = (
-        html_template
-        .replace("##MARKERS_PLACEHOLDER##", marker_js)
-        .replace("__API_KEY__", api_key)
-        .replace("__MAP_ID__", map_id or "")
-    )
-    st.components.v1.html(html_content, height=800)
+from data_loader import load_dataset
+from instrumentation import stage
+from map4d import density_mode, map4d_credentials, render_map4d
+from tile_export import tile_source
+from filter_index import get_filter_index
+from paged_table import render_paged_table
+from exports import render_export_buttons
+from aggregates import aggregate
+from charts import bar_figure, pie_figure, show_figure
 
 def main():
     if __name__ == "__main__":
@@ -40,32 +15,34 @@ def main():
     
     st.title("🏦 Bản đồ Cơ sở Ngân hàng")
     
-    file_path = os.path.join(os.path.dirname(__file__), "banking_data.csv")
     try:
-        df = pd.read_csv(file_path)
+        with stage("load") as perf:
+            df = load_dataset("banking")
+            perf["rows_out"] = len(df)
     except Exception as e:
         st.error(f"❌ Lỗi khi đọc file CSV: {e}")
         return
 
     st.write("### Dữ liệu gốc:")
-    st.dataframe(df)
+    render_paged_table(df, key="bank_raw_table")
 
     # Các bộ lọc được chuyển sang sidebar
-    city_options = ['Tất cả'] + sorted(df['city'].dropna().unique().tolist())
-    bank_options = ['Tất cả'] + sorted(df['bank'].dropna().unique().tolist())
+    filters = get_filter_index(df, ['city', 'bank'])
+    city_options = filters.options('city')
+    bank_options = filters.options('bank')
     
     st.sidebar.header("Bộ lọc Ngân hàng")
     selected_city = st.sidebar.selectbox("Chọn thành phố:", options=city_options, key="bank_city_filter")
     selected_bank = st.sidebar.selectbox("Chọn ngân hàng:", options=bank_options, key="bank_filter")
     
-    filtered_df = df.copy()
-    if selected_city != "Tất cả":
-        filtered_df = filtered_df[filtered_df['city'] == selected_city]
-    if selected_bank != "Tất cả":
-        filtered_df = filtered_df[filtered_df['bank'] == selected_bank]
+    selections = {'city': selected_city, 'bank': selected_bank}
+    with stage("filter", rows_in=len(df)) as perf:
+        filtered_df = filters.select(selections)
+        perf["rows_out"] = len(filtered_df)
     
     st.write(f"### Dữ liệu đã lọc (số dòng: {filtered_df.shape[0]}):")
-    st.dataframe(filtered_df[['id', 'bank', 'bank_name', 'name', 'city', 'latitude', 'longitude']])
+    render_paged_table(filtered_df, key="bank_filtered_table", columns=['id', 'bank', 'bank_name', 'name', 'city', 'latitude', 'longitude'])
+    render_export_buttons("banking", df, filters.positions(selections), selections, key="bank")
     
     with st.expander("Phân tích dữ liệu tọa độ"):
         total_rows = filtered_df.shape[0]
@@ -76,15 +53,19 @@ def main():
         st.write(f"Số dòng có tọa độ hợp lệ: {valid_count}")
         st.write(f"Số dòng thiếu tọa độ: {missing_count} ({(missing_count/total_rows*100):.2f}%)")
         
-        missing_by_city = missing_coords.groupby('city').size().reset_index(name='missing_count')
+        missing_by_city = missing_coords.groupby('city', observed=True).size().reset_index(name='missing_count')
         st.write("Số dòng thiếu tọa độ theo thành phố:")
         st.dataframe(missing_by_city)
         
-        missing_by_bank = missing_coords.groupby('bank').size().reset_index(name='missing_count')
+        missing_by_bank = missing_coords.groupby('bank', observed=True).size().reset_index(name='missing_count')
         st.write("Số dòng thiếu tọa độ theo ngân hàng:")
         st.dataframe(missing_by_bank)
+
+        if 'coord_source' in filtered_df.columns:
+            st.write("Nguồn tọa độ (điền từ gazetteer theo mã địa chỉ/phường/quận/tỉnh):")
+            st.dataframe(filtered_df['coord_source'].value_counts().rename_axis('coord_source').reset_index(name='count'))
     
-    map_df = filtered_df.dropna(subset=["latitude", "longitude"])
+    map_df = filters.located(selections)
     
     if "map_visible_bank" not in st.session_state:
         st.session_state.map_visible_bank = False
@@ -94,35 +75,36 @@ def main():
     width = st.sidebar.slider("Chọn chiều rộng biểu đồ:", min_value=400, max_value=1200, value=800)
     height = st.sidebar.slider("Chọn chiều cao biểu đồ:", min_value=300, max_value=800, value=400)
     chart_option = st.sidebar.selectbox("Chọn biểu đồ:", options=["Cột chồng", "Tròn"], key="chart_option")
-    if chart_option == "Cột chồng":
-        st.markdown("### 📈 Biểu đồ cột chồng: Số lượng ATM và phòng giao dịch theo loại hình")
-        type_subtype_counts = filtered_df.groupby(['bank', 'type']).size().reset_index(name='count')
-        fig1 = px.bar(
-            type_subtype_counts, 
-            x='bank', 
-            y='count', 
-            color='type',
-            labels={'bank': 'Ngân hàng', 'count': 'Số lượng', 'type': 'Loại hình'},
-            title="Số lượng ATM và địa điểm giao dịch theo ngân hàng và loại hình",
-            barmode='stack'
-        )
-        fig1.update_layout(width=width, height=height, xaxis_title="Ngân hàng", yaxis_title="Số lượng")
-        st.plotly_chart(fig1)
-    elif chart_option == "Tròn":
-        st.markdown("### 🥧 Biểu đồ tròn: Tỉ lệ địa điểm giao dịch theo ngân hàng")
-        type_counts = df['bank'].value_counts()
-        fig2 = px.pie(
-            names=type_counts.index, 
-            values=type_counts.values, 
-            title="Tỉ lệ phần trăm ngân hàng"
-        )
-        fig2.update_layout(width=width, height=height)
-        st.plotly_chart(fig2)
+    with stage("chart"):
+        if chart_option == "Cột chồng":
+            st.markdown("### 📈 Biểu đồ cột chồng: Số lượng ATM và phòng giao dịch theo loại hình")
+            type_subtype_counts = aggregate(df, ['bank', 'type'], selections)
+            fig1 = bar_figure(
+                type_subtype_counts,
+                x='bank', 
+                y='count', 
+                color='type',
+                labels={'bank': 'Ngân hàng', 'count': 'Số lượng', 'type': 'Loại hình'},
+                title="Số lượng ATM và địa điểm giao dịch theo ngân hàng và loại hình"
+            )
+            show_figure(fig1, width, height, xaxis_title="Ngân hàng", yaxis_title="Số lượng")
+        elif chart_option == "Tròn":
+            st.markdown("### 🥧 Biểu đồ tròn: Tỉ lệ địa điểm giao dịch theo ngân hàng")
+            type_counts = aggregate(df, ['bank'])
+            fig2 = pie_figure(
+                type_counts,
+                names='bank',
+                values='count',
+                title="Tỉ lệ phần trăm ngân hàng"
+            )
+            show_figure(fig2, width, height)
     if st.session_state.map_visible_bank:
-        if not MAP4D_API_KEY:
+        api_key, map_id = map4d_credentials()
+        if not api_key:
             st.warning("⚠️ Vui lòng cấu hình MAP4D_API_KEY trong phần Secrets của Streamlit")
         else:
-            render_map4d(map_df, api_key=MAP4D_API_KEY, map_id=MAP4D_MAP_ID)
+            render_map4d(map_df, api_key=api_key, map_id=map_id, tiles=tile_source("banking", selections),
+                         hexbin=density_mode("bank_map_mode"))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,279 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+from aggregates import aggregate
+from data_loader import BASE_DIR, DATASETS, load_csv
+from filter_index import FilterIndex
+import charts
+import map4d
+from map4d import build_cluster_json, build_points_json
+from paged_table import page_table
+
+# Đo từng giai đoạn xử lý dữ liệu của các trang mà không cần trình duyệt, trên bản
+# dữ liệu tổng hợp gấp 10x/100x/1000x, rồi ghi báo cáo JSON để so sánh giữa các commit.
+# Chạy: python benchmark.py --scales 10 100 --output bench.json [--compare base.json]
+
+# Cấu hình dữ liệu của từng trang: cột lọc, cột biểu đồ, cột toạ độ/tên và bảng hiển thị
+PAGES = {
+    "powerplant": {
+        "filters": ["type", "sub_type", "province"],
+        "chart": ["type", "sub_type"],
+        "value": "capacity",
+        "coords": ("lat", "lon", "name"),
+        "table": ["name", "type", "sub_type", "river", "lat", "lon", "province"],
+    },
+    "banking": {
+        "filters": ["city", "bank"],
+        "chart": ["bank", "type"],
+        "value": None,
+        "coords": ("latitude", "longitude", "name"),
+        "table": ["id", "bank", "bank_name", "name", "city", "latitude", "longitude"],
+    },
+    "retail": {
+        "filters": ["city", "retail_chain"],
+        "chart": ["retail_chain", "type"],
+        "value": None,
+        "coords": ("latitude", "longitude", "name"),
+        "table": ["id", "retail_chain", "name", "type", "address", "city", "latitude", "longitude"],
+    },
+    "industry": {
+        "filters": ["city", "investor"],
+        "chart": None,
+        "value": None,
+        "coords": ("latitude", "longitude", "name"),
+        "table": ["id", "name", "investor", "address", "city", "latitude", "longitude"],
+    },
+}
+
+# Cột văn bản gần như duy nhất theo dòng: thêm hậu tố cho các bản sao để độ đa dạng tăng theo quy mô
+UNIQUE_TEXT_COLUMNS = ["name", "Column1", "address"]
+COORD_JITTER_DEG = 0.01
+
+DEFAULT_SCALES = [10, 100, 1000]
+# Giai đoạn chậm hơn ngưỡng này so với báo cáo gốc bị coi là suy giảm
+REGRESSION_RATIO = 1.2
+# Bỏ qua các giai đoạn quá ngắn, dễ nhiễu
+MIN_COMPARE_SECONDS = 0.005
+
+
+def synthesize(raw, scale, seed=0):
+    # Lấy mẫu có hoàn lại từ dữ liệu thật: giữ nguyên lược đồ và phân bố các cột phân loại
+    n = len(raw) * scale
+    rng = np.random.default_rng(seed)
+    df = raw.iloc[rng.integers(0, len(raw), n)].reset_index(drop=True)
+    copy_no = pd.Series(np.arange(n) // len(raw)).astype(str)
+
+    if "id" in df.columns:
+        df["id"] = np.arange(1, n + 1)
+    for col in UNIQUE_TEXT_COLUMNS:
+        if col in df.columns:
+            text = df[col].astype("object")
+            df[col] = text.where(text.isna() | (copy_no == "0"), text + " #" + copy_no)
+
+    for lat_col, lon_col in [("latitude", "longitude")]:
+        if lat_col in df.columns:
+            df[lat_col] = df[lat_col] + rng.normal(0, COORD_JITTER_DEG, n)
+            df[lon_col] = df[lon_col] + rng.normal(0, COORD_JITTER_DEG, n)
+    if "latlng" in df.columns:
+        parts = df["latlng"].astype("object").str.replace('"', '', regex=False).str.split(",", n=1, expand=True)
+        lat = pd.to_numeric(parts[0], errors="coerce") + rng.normal(0, COORD_JITTER_DEG, n)
+        lon = pd.to_numeric(parts[1], errors="coerce") + rng.normal(0, COORD_JITTER_DEG, n)
+        latlng = lat.round(8).astype(str) + ", " + lon.round(8).astype(str)
+        df["latlng"] = latlng.where(lat.notna() & lon.notna())
+    return df
+
+
+def synthetic_path(workdir, name, scale, seed=0):
+    spec = DATASETS[name]
+    path = os.path.join(workdir, f"x{scale}-seed{seed}", spec["file"])
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        raw = pd.read_csv(os.path.join(BASE_DIR, spec["file"]), **spec["read_csv"])
+        tmp_path = f"{path}.tmp"
+        synthesize(raw, scale, seed).to_csv(tmp_path, index=False, sep=spec["read_csv"].get("sep", ","))
+        os.replace(tmp_path, path)
+    return path
+
+
+class StageTimer:
+    def __init__(self, repeat=3):
+        self.repeat = repeat
+        self.results = []
+
+    @contextmanager
+    def stage(self, dataset, scale, stage):
+        # Giai đoạn chỉ chạy được một lần (vd. nạp lạnh có ghi snapshot); gán entry["rows"] bên trong
+        entry = {"dataset": dataset, "scale": scale, "stage": stage, "rows": 0}
+        start = time.perf_counter()
+        yield entry
+        entry["seconds"] = time.perf_counter() - start
+        self.results.append(entry)
+
+    def run(self, dataset, scale, stage, rows, func):
+        # Lấy thời gian nhỏ nhất qua các lần lặp để giảm nhiễu; rows=None: lấy số dòng của kết quả
+        best, value = None, None
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            value = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        if rows is None:
+            rows = len(value)
+        self.results.append({"dataset": dataset, "scale": scale, "stage": stage, "rows": int(rows), "seconds": best})
+        return value
+
+
+def _top_value(df, col):
+    counts = df[col].value_counts()
+    return counts.index[0] if len(counts) else None
+
+
+def bench_dataset(timer, name, scale, path):
+    spec = DATASETS[name]
+    page = PAGES[name]
+    prepare = spec.get("prepare")
+
+    # Nạp lạnh: đọc CSV, chuẩn hoá, ghi snapshot; sau đó nạp lại từ snapshot
+    snap = data_loader.snapshot_path(path)
+    if os.path.exists(snap):
+        os.remove(snap)
+    raw = timer.run(name, scale, "read_csv", None, lambda: pd.read_csv(path, **spec["read_csv"]))
+    if prepare is not None:
+        timer.run(name, scale, "clean", len(raw), lambda raw=raw: prepare(raw))
+    del raw
+    data_loader.clear_cache()
+    with timer.stage(name, scale, "load_cold") as entry:
+        df = load_csv(path, prepare=prepare, **spec["read_csv"])
+        entry["rows"] = len(df)
+
+    def load_snapshot():
+        data_loader.clear_cache()
+        return load_csv(path, prepare=prepare, **spec["read_csv"])
+
+    df = timer.run(name, scale, "load_snapshot", len(df), load_snapshot)
+    rows = len(df)
+
+    index = timer.run(name, scale, "filter_index", rows, lambda: FilterIndex(df, page["filters"]))
+    selections = {col: _top_value(df, col) for col in page["filters"]}
+    first = {page["filters"][0]: selections[page["filters"][0]]}
+    timer.run(name, scale, "filter_one", rows, lambda: index.positions(first))
+    filtered = df.iloc[timer.run(name, scale, "filter_all", rows, lambda: index.positions(selections))]
+    timer.run(name, scale, "filter_mask_baseline", rows, lambda: df[np.logical_and.reduce([(df[c] == v).to_numpy() for c, v in selections.items()])])
+
+    if page["chart"]:
+        timer.run(name, scale, "aggregate", rows, lambda: aggregate(df.copy(deep=False), page["chart"], first, page["value"]))
+        timer.run(name, scale, "aggregate_groupby_baseline", rows, lambda: df[df[page["filters"][0]] == first[page["filters"][0]]].groupby(page["chart"], observed=True).size())
+
+        def figure():
+            # Figure được nhớ theo nội dung: xoá cache để mỗi lần lặp đều dựng lại
+            charts.clear_cache()
+            x, color = page["chart"]
+            return charts.bar_figure(aggregate(df, page["chart"]), x, "count", color=color)
+
+        timer.run(name, scale, "chart_figure", rows, figure)
+
+    lat_col, lon_col, name_col = page["coords"]
+    map_df = df[[lat_col, lon_col, name_col]]
+
+    def markers(builder):
+        # Payload được nhớ theo đối tượng bảng: xoá cache để mỗi lần lặp đều dựng lại
+        map4d.clear_cache()
+        return builder(map_df, lat_col, lon_col, name_col)
+
+    timer.run(name, scale, "markers_points", rows, lambda: markers(build_points_json))
+    timer.run(name, scale, "markers_clusters", rows, lambda: markers(build_cluster_json))
+
+    timer.run(name, scale, "table_page", rows, lambda: page_table(df.copy(deep=False), 0, 50, columns=page["table"]))
+    timer.run(name, scale, "table_page_sorted", rows, lambda: page_table(df.copy(deep=False), 0, 50, columns=page["table"], sort_by=name_col))
+    timer.run(name, scale, "table_page_filtered", len(filtered), lambda: page_table(filtered.copy(deep=False), 0, 50, columns=page["table"]))
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(scales=DEFAULT_SCALES, datasets=None, workdir=None, repeat=3, seed=0):
+    workdir = workdir or os.path.join(tempfile.gettempdir(), "trade_streamlit_bench")
+    timer = StageTimer(repeat=repeat)
+    for scale in scales:
+        for name in datasets or list(PAGES):
+            path = synthetic_path(workdir, name, scale, seed)
+            bench_dataset(timer, name, scale, path)
+            print(f"  {name} x{scale}: xong", file=sys.stderr)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "scales": list(scales),
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": timer.results,
+    }
+
+
+def compare_reports(base, current, ratio=REGRESSION_RATIO):
+    # Trả về danh sách (dataset, scale, stage, giây cũ, giây mới, tỉ lệ) bị chậm đi quá ngưỡng
+    base_times = {(r["dataset"], r["scale"], r["stage"]): r["seconds"] for r in base["results"]}
+    regressions = []
+    for r in current["results"]:
+        key = (r["dataset"], r["scale"], r["stage"])
+        old = base_times.get(key)
+        if old is None or max(old, r["seconds"]) < MIN_COMPARE_SECONDS:
+            continue
+        change = r["seconds"] / old if old > 0 else float("inf")
+        if change > ratio:
+            regressions.append(key + (old, r["seconds"], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark các giai đoạn dữ liệu của từng trang")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES)
+    parser.add_argument("--datasets", nargs="+", choices=list(PAGES), default=None)
+    parser.add_argument("--workdir", default=None, help="thư mục chứa CSV tổng hợp (được dùng lại giữa các lần chạy)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", default=None, help="báo cáo JSON gốc để phát hiện suy giảm hiệu năng")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_RATIO)
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.scales, args.datasets, args.workdir, args.repeat, args.seed)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    table = pd.DataFrame(report["results"])
+    print(table.pivot_table(index=["dataset", "stage"], columns="scale", values="seconds", sort=False).round(4).to_string())
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+        regressions = compare_reports(base, report, args.threshold)
+        for dataset, scale, stage, old, new, change in regressions:
+            print(f"CHẬM HƠN: {dataset} x{scale} {stage}: {old:.4f}s -> {new:.4f}s ({change:.2f}x)")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
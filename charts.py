@@ -0,0 +1,132 @@
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+
+from frame_cache import IdentityLRU
+
+# Figure gốc (dữ liệu + nhãn, chưa có kích thước) nhớ theo nội dung bảng tổng hợp
+FIGURE_CACHE_SIZE = 64
+# Từ số nhóm này trở lên chuyển sang chế độ cột gọn: không lặp nhãn nhóm trong từng trace
+COMPACT_MIN_CATEGORIES = 500
+# Số nhãn tối đa trên trục nhóm ở chế độ cột gọn
+MAX_TICK_LABELS = 60
+
+_figure_cache = IdentityLRU(FIGURE_CACHE_SIZE, "figure")
+
+
+def _content_key(data, columns):
+    # Bảng tổng hợp chỉ vài trăm dòng: băm nội dung rẻ hơn dựng lại figure
+    part = data[list(columns)]
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((len(part), tuple(map(str, part.dtypes)))).encode())
+    digest.update(pd.util.hash_pandas_object(part, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _memoize(key, builder):
+    # Mỗi figure có khoá riêng: cập nhật kích thước và tuần tự hoá không chen nhau giữa các phiên
+    return _figure_cache.get_or_build(key, lambda: (builder(), threading.Lock()))
+
+
+def _categories(series):
+    return series.to_numpy(dtype=object)
+
+
+def _hover(labels, *names):
+    return "<br>".join(f"{labels.get(name, name)}=%{{{axis}}}" for name, axis in names) + "<extra></extra>"
+
+
+def _build_bar(data, x, y, color, orientation, labels, title):
+    horizontal = orientation == "h"
+    cat_col, value_col = (y, x) if horizontal else (x, y)
+    cat_axis, value_axis = ("y", "x") if horizontal else ("x", "y")
+    groups = [(None, data)] if color is None else list(data.groupby(color, sort=False, observed=True))
+    n_categories = data[cat_col].nunique()
+
+    fig = go.Figure()
+    if n_categories < COMPACT_MIN_CATEGORIES:
+        hover = [(cat_col, cat_axis), (value_col, value_axis)]
+        for name, group in groups:
+            cats = _categories(group[cat_col])
+            values = group[value_col].to_numpy(dtype=np.float64)
+            extra = [] if color is None else [(color, "fullData.name")]
+            fig.add_trace(go.Bar(
+                x=values if horizontal else cats,
+                y=cats if horizontal else values,
+                orientation=orientation,
+                name=None if name is None else str(name),
+                showlegend=name is not None,
+                hovertemplate=_hover(labels, *extra, *hover),
+            ))
+    else:
+        # Nhiều nhóm: mỗi màu là một trace cột theo vị trí ngầm định (x0/dx) với giá trị
+        # float32 dạng nhị phân; nhãn nhóm chỉ nằm một lần trên trục thay vì lặp lại ở mọi trace
+        order = pd.unique(data[cat_col])
+        position = pd.Index(order)
+        for name, group in groups:
+            values = np.zeros(len(order), dtype=np.float32)
+            np.add.at(values, position.get_indexer(group[cat_col]), group[value_col].to_numpy(dtype=np.float32))
+            axis = {"x" if horizontal else "y": values, f"{cat_axis}0": 0, f"d{cat_axis}": 1}
+            fig.add_trace(go.Bar(
+                **axis,
+                orientation=orientation,
+                name=None if name is None else str(name),
+                showlegend=name is not None,
+                hovertemplate=f"%{{{value_axis}}}<extra>%{{fullData.name}}</extra>",
+            ))
+        step = -(-len(order) // MAX_TICK_LABELS)
+        ticks = np.arange(0, len(order), step)
+        fig.update_layout({f"{cat_axis}axis": {
+            "tickmode": "array",
+            "tickvals": ticks,
+            "ticktext": [str(label) for label in order[ticks]],
+        }})
+
+    fig.update_layout(
+        title=title,
+        barmode="stack",
+        legend_title_text=labels.get(color, color) if color else None,
+        xaxis_title=labels.get(x, x),
+        yaxis_title=labels.get(y, y),
+    )
+    return fig
+
+
+def bar_figure(data, x, y, color=None, orientation="v", labels=None, title=None):
+    # Tương đương px.bar(..., barmode='stack') nhưng dựng trực tiếp bằng graph_objects
+    # và nhớ theo nội dung: đổi kích thước không dựng lại figure
+    labels = labels or {}
+    columns = [c for c in (x, y, color) if c is not None]
+    key = ("bar", _content_key(data, columns), x, y, color, orientation, tuple(sorted(labels.items())), title)
+    return _memoize(key, lambda: _build_bar(data, x, y, color, orientation, labels, title))
+
+
+def pie_figure(data, names, values, title=None):
+    key = ("pie", _content_key(data, [names, values]), names, values, title)
+
+    def build():
+        fig = go.Figure(go.Pie(
+            labels=_categories(data[names]),
+            values=data[values].to_numpy(dtype=np.float64),
+            hovertemplate=f"{names}=%{{label}}<br>{values}=%{{value}}<extra></extra>",
+        ))
+        fig.update_layout(title=title)
+        return fig
+
+    return _memoize(key, build)
+
+
+def show_figure(figure, width, height, **layout):
+    # Chỉ bố cục thay đổi theo slider: áp lên figure đã nhớ rồi gửi đi
+    fig, lock = figure
+    with lock:
+        fig.update_layout(width=width, height=height, **layout)
+        st.plotly_chart(fig)
+
+
+def clear_cache():
+    _figure_cache.clear()
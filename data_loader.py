@@ -0,0 +1,289 @@
+import hashlib
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from frame_cache import release_frames
+from instrumentation import cache_event
+from ingest import prepare_banking, prepare_powerplant, prepare_retail
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Tăng khi thay đổi cách đọc/chuẩn hoá dữ liệu để snapshot cũ tự bị bỏ qua
+SNAPSHOT_VERSION = "3"
+# Thời gian tối đa (giây) một trang chờ lượt khởi động dựng xong bảng trước khi tự đọc file
+WARMUP_WAIT = 120.0
+
+DATASETS = {
+    # prepare: bước chuẩn hoá chạy một lần trước khi ghi snapshot
+    "powerplant": {"file": "input.csv", "read_csv": {"sep": "\t"}, "prepare": prepare_powerplant},
+    # Mã dạng "01" phải đọc là chuỗi: với file lớn pandas đọc theo khối và có thể trộn str/int,
+    # khiến cột không chuyển được sang Arrow và snapshot bị bỏ qua
+    "banking": {
+        "file": "banking_data.csv",
+        "read_csv": {"dtype": {"city_code": str, "address_code": str}},
+        "prepare": prepare_banking,
+    },
+    "retail": {"file": "retail_chain_data.csv", "read_csv": {}, "prepare": prepare_retail},
+    "industry": {"file": "kcn.csv", "read_csv": {}},
+}
+
+# Cache dùng chung cho cả tiến trình: (path, tên bước chuẩn hoá, cột) -> entry
+_cache = {}
+_cache_lock = threading.Lock()
+_path_locks = {}
+# Phiên bản do bộ làm mới nền công bố: tên dataset -> {"version", "df", "stat", "hash", "views"}
+_published = {}
+# Bảng đang được lượt khởi động của refresher.py dựng: tên dataset -> Event đặt khi xong (hoặc lỗi)
+_warmup = {}
+
+
+def _path_lock(path):
+    with _cache_lock:
+        return _path_locks.setdefault(path, threading.Lock())
+
+
+def _file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".feather"
+
+
+def _prepare_name(prepare):
+    return prepare.__name__ if prepare is not None else "raw"
+
+
+def _snapshot_key(source_hash, prepare_name="raw"):
+    return f"{SNAPSHOT_VERSION}:{prepare_name}:{source_hash}"
+
+
+def _read_snapshot(path, source_hash, prepare_name="raw", columns=None):
+    if not os.path.exists(path):
+        return None
+    try:
+        with pa.memory_map(path, "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+    metadata = table.schema.metadata or {}
+    if metadata.get(b"trade_streamlit.source") != _snapshot_key(source_hash, prepare_name).encode():
+        return None
+    if columns is not None:
+        # Snapshot được memory-map: các cột không chọn không bao giờ được nạp vào RAM
+        if any(col not in table.column_names for col in columns):
+            return None
+        table = table.select(list(columns))
+    # split_blocks: không gộp cột vào khối 2D, để cột chuỗi/số không null trỏ thẳng vào vùng
+    # memory-map (trang của file được chia sẻ giữa mọi phiên và mọi tiến trình server)
+    return table.to_pandas(split_blocks=True)
+
+
+def _write_snapshot(df, path, source_hash, prepare_name="raw"):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b"trade_streamlit.source"] = _snapshot_key(source_hash, prepare_name).encode()
+        table = table.replace_schema_metadata(metadata)
+        # Không nén để lần đọc sau có thể memory-map trực tiếp
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+        return True
+    except (OSError, pa.ArrowException):
+        # Thư mục chỉ đọc (vd. môi trường deploy) hoặc cột không chuyển được sang Arrow:
+        # bỏ qua snapshot, vẫn dùng cache RAM
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def load_csv(path, prepare=None, columns=None, **read_csv_kwargs):
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    stat_key = (stat.st_mtime_ns, stat.st_size)
+    prepare_name = _prepare_name(prepare)
+    if columns is not None:
+        columns = tuple(columns)
+    cache_key = (path, prepare_name, columns)
+
+    entry = _cache.get(cache_key)
+    if entry is not None and entry["stat"] == stat_key:
+        cache_event("dataset", True)
+        return entry["df"]
+
+    with _path_lock(path):
+        entry = _cache.get(cache_key)
+        if entry is not None and entry["stat"] == stat_key:
+            cache_event("dataset", True)
+            return entry["df"]
+        cache_event("dataset", False)
+
+        source_hash = _file_sha1(path)
+        full = _cache.get((path, prepare_name, None))
+        if entry is not None and entry["hash"] == source_hash:
+            # Chỉ đổi mtime (vd. touch/checkout), nội dung không đổi
+            df, origin = entry["df"], entry["origin"]
+        elif columns is not None and full is not None and full["hash"] == source_hash:
+            # Bảng đầy đủ đã có sẵn trong RAM: cắt cột từ đó
+            df, origin = full["df"][list(columns)], full["origin"]
+        else:
+            snap = snapshot_path(path)
+            df = _read_snapshot(snap, source_hash, prepare_name, columns)
+            cache_event("snapshot", df is not None)
+            origin = "snapshot"
+            if df is None:
+                df = pd.read_csv(path, **read_csv_kwargs)
+                if prepare is not None:
+                    df = prepare(df)
+                written = _write_snapshot(df, snap, source_hash, prepare_name)
+                # Bản vừa parse nằm trong bộ nhớ riêng của tiến trình: đọc lại từ snapshot
+                # để bảng dùng chung giữa các phiên trỏ vào vùng memory-map
+                mapped = _read_snapshot(snap, source_hash, prepare_name, columns) if written else None
+                if mapped is not None:
+                    df = mapped
+                else:
+                    origin = "csv"
+                    if columns is not None:
+                        df = df[list(columns)]
+
+        _cache[cache_key] = {"stat": stat_key, "hash": source_hash, "df": df, "origin": origin}
+    if entry is not None and entry["df"] is not df and \
+            not any(published["df"] is entry["df"] for published in list(_published.values())):
+        # Bản đọc trước của file này không còn được phục vụ; bản đang công bố thì publish() gỡ khi thay
+        release_frames(entry["df"])
+    return df
+
+
+def load_dataset(name, path=None, columns=None, wait=True):
+    # columns: chỉ nạp các cột trang cần hiển thị (None = toàn bộ).
+    # Khi đã có phiên bản được công bố (refresher.py), trả ngay bản đó mà không kiểm tra file:
+    # rerun không bao giờ chờ nạp lại hay đọc phải file đang ghi dở.
+    # wait: khi bảng đang được lượt khởi động dựng thì chờ bản đó (đã có chỉ mục) thay vì tự đọc;
+    # chính các luồng khởi động phải truyền False để không chờ lẫn nhau
+    published = _published.get(name) if path is None else None
+    if published is None and path is None and wait:
+        event = _warmup.get(name)
+        if event is not None:
+            event.wait(WARMUP_WAIT)
+            published = _published.get(name)
+    if published is not None:
+        if columns is None:
+            return published["df"]
+        columns = tuple(columns)
+        view = published["views"].get(columns)
+        if view is None:
+            view = published["views"][columns] = published["df"][list(columns)]
+        return view
+    return read_dataset(name, path, columns)
+
+
+def read_dataset(name, path=None, columns=None):
+    # Đọc theo file trên đĩa (qua cache và snapshot), bỏ qua phiên bản đã công bố
+    spec = DATASETS[name]
+    if path is None:
+        path = dataset_path(name)
+    return load_csv(path, prepare=spec.get("prepare"), columns=columns, **spec["read_csv"])
+
+
+def dataset_path(name):
+    return os.path.join(BASE_DIR, DATASETS[name]["file"])
+
+
+def source_hash(path):
+    # SHA-1 của file nguồn; dùng lại giá trị đã tính khi nạp nếu file chưa đổi
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    stat_key = (stat.st_mtime_ns, stat.st_size)
+    for (cached_path, _, _), entry in list(_cache.items()):
+        if cached_path == path and entry["stat"] == stat_key:
+            return entry["hash"]
+    return _file_sha1(path)
+
+
+def publish(name, df, stat_key, source_hash):
+    # Thay phiên bản đang phục vụ bằng một phép gán: rerun đang chạy giữ bản cũ tới hết lượt
+    with _cache_lock:
+        previous = _published.get(name)
+        version = previous["version"] + 1 if previous is not None else 1
+        _published[name] = {"version": version, "df": df, "stat": stat_key, "hash": source_hash, "views": {}}
+    if previous is not None and previous["df"] is not df:
+        # Gỡ chỉ mục/kết quả nhớ của bản cũ khỏi mọi cache theo bảng để bộ nhớ của nó được trả lại
+        release_frames(previous["df"], *previous["views"].values())
+    return version
+
+
+def begin_warmup(names):
+    # Đánh dấu các bảng chưa công bố là đang khởi động; gọi trước khi trang đầu tiên có thể đọc
+    with _cache_lock:
+        for name in names:
+            if name not in _published and name not in _warmup:
+                _warmup[name] = threading.Event()
+
+
+def end_warmup(name):
+    # Gọi cả khi dựng lỗi: trang đang chờ chuyển sang tự đọc file
+    with _cache_lock:
+        event = _warmup.pop(name, None)
+    if event is not None:
+        event.set()
+
+
+def warmup_status():
+    # Tên dataset -> "ready" (đã công bố), "warming" (đang dựng) hoặc "cold" (trang tự đọc khi cần)
+    return {
+        name: "ready" if name in _published else "warming" if name in _warmup else "cold"
+        for name in DATASETS
+    }
+
+
+def published_stat(name):
+    published = _published.get(name)
+    return published["stat"] if published is not None else None
+
+
+def dataset_version(name):
+    # 0: chưa có phiên bản nào được công bố, trang đọc trực tiếp theo file
+    published = _published.get(name)
+    return published["version"] if published is not None else 0
+
+
+def dataset_source_hash(name):
+    # Nhãn nội dung của dữ liệu trang đang thấy: bản đã công bố mang nhãn refresher.py gắn
+    # (gồm cả bản đã điền toạ độ, geocode.served_source), ngược lại là hash file nguồn
+    published = _published.get(name)
+    if published is not None:
+        return published["hash"]
+    return source_hash(dataset_path(name))
+
+
+def cache_info():
+    # Các bảng đang giữ trong kho dùng chung của tiến trình (mọi phiên đọc cùng một bản)
+    names = {dataset_path(name): name for name in DATASETS}
+    rows = []
+    for (path, prepare_name, columns), entry in list(_cache.items()):
+        df = entry["df"]
+        name = names.get(path)
+        rows.append({
+            "file": os.path.basename(path),
+            "columns": "*" if columns is None else len(columns),
+            "rows": len(df),
+            "bytes": int(df.memory_usage(index=False).sum()),
+            "origin": entry["origin"],
+            "version": dataset_version(name) if name is not None else None,
+        })
+    return rows
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+        _published.clear()
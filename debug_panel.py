@@ -0,0 +1,43 @@
+import pandas as pd
+import streamlit as st
+
+from data_loader import cache_info, warmup_status
+from instrumentation import cache_totals, memory_tracing
+
+
+def render_debug_panel(run):
+    # Bảng số liệu của lần rerun vừa xong; vẽ sau khi trang chạy xong để có đủ các giai đoạn
+    if not st.sidebar.checkbox("🐞 Số liệu hiệu năng", key="perf_debug"):
+        return
+    # tracemalloc bật/tắt cho cả tiến trình nên không để từng phiên điều khiển
+    if memory_tracing():
+        st.sidebar.caption("Đo bộ nhớ đang bật (PERF_TRACE_MEMORY): mem_peak_bytes là gần đúng khi nhiều phiên chạy cùng lúc.")
+    else:
+        st.sidebar.caption("Đo bộ nhớ: khởi động app với PERF_TRACE_MEMORY=1.")
+    if run is None:
+        return
+
+    with st.sidebar.expander("Giai đoạn trong lần chạy này", expanded=True):
+        st.write(f"Trang: {run['page']} · tổng {run.get('seconds', 0) * 1000:.0f} ms")
+        stages = pd.DataFrame(run["stages"])
+        if not stages.empty:
+            stages["ms"] = (stages.pop("seconds") * 1000).round(1)
+            st.dataframe(stages)
+
+    with st.sidebar.expander("Cache hit/miss"):
+        rows = []
+        for cache, totals in sorted(cache_totals().items()):
+            counts = run["cache"].get(cache, {"hit": 0, "miss": 0})
+            rows.append({
+                "cache": cache,
+                "hit": counts["hit"],
+                "miss": counts["miss"],
+                "hit (tiến trình)": totals["hit"],
+                "miss (tiến trình)": totals["miss"],
+            })
+        st.dataframe(pd.DataFrame(rows))
+
+    with st.sidebar.expander("Kho dữ liệu dùng chung"):
+        # origin "snapshot": cột trỏ vào file memory-map, không nhân bản theo phiên/tiến trình
+        st.dataframe(pd.DataFrame(cache_info()))
+        st.write("Khởi động: " + ", ".join(f"{name} {state}" for name, state in warmup_status().items()))
@@ -0,0 +1,221 @@
+import hashlib
+import itertools
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import streamlit as st
+
+from data_loader import dataset_source_hash, dataset_version
+from filter_index import ALL
+from geocode import precise_rows
+from instrumentation import cache_event, stage
+from tile_export import STATIC_DIR
+
+# Xuất bảng đã lọc ra CSV/Parquet/GeoJSON. File được mã hoá theo từng khối dòng trên vị trí
+# đã lọc (không dựng bản sao toàn bộ), ghi thẳng xuống đĩa và nhớ theo trạng thái bộ lọc.
+# Khi bật server.enableStaticServing, trình duyệt tải file trực tiếp từ static/ (đọc dần từ đĩa);
+# nếu không, file chỉ được đọc vào bộ nhớ cho nút tải ở lượt chạy người dùng bấm "Tạo file".
+
+EXPORT_DIR = os.path.join(STATIC_DIR, "exports")
+EXPORT_URL = "app/static/exports"
+# Tăng khi đổi cách mã hoá để file cũ tự bị bỏ qua
+EXPORT_VERSION = "3"
+# Số dòng mã hoá mỗi lượt: bộ nhớ khi xuất chỉ phụ thuộc cỡ khối, không theo số dòng đã lọc
+EXPORT_CHUNK_ROWS = 50_000
+# Số file xuất giữ lại trên đĩa; file cũ nhất (theo lần dùng cuối) bị xoá trước
+EXPORT_CACHE_FILES = 32
+# Giới hạn cỡ file của server.enableStaticServing; file lớn hơn đi qua nút tải
+STATIC_MAX_BYTES = 200 * 1024 * 1024
+
+# Định dạng -> (đuôi file, MIME)
+FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+    "GeoJSON": (".geojson", "application/geo+json"),
+}
+
+# Cột toạ độ của từng bảng cho GeoJSON
+COORDS = {
+    "powerplant": ("lat", "lon"),
+    "banking": ("latitude", "longitude"),
+    "retail": ("latitude", "longitude"),
+    "industry": ("latitude", "longitude"),
+}
+
+_file_locks = {}
+_lock = threading.Lock()
+
+
+def _file_lock(path):
+    with _lock:
+        return _file_locks.setdefault(path, threading.Lock())
+
+
+def _chunks(df, rows, columns):
+    # rows: vị trí dòng đã lọc (None = toàn bộ bảng); mỗi lượt chỉ sao chép một khối
+    total = len(df) if rows is None else len(rows)
+    for start in range(0, total, EXPORT_CHUNK_ROWS):
+        stop = min(start + EXPORT_CHUNK_ROWS, total)
+        chunk = df.iloc[start:stop] if rows is None else df.iloc[rows[start:stop]]
+        yield chunk if columns is None else chunk[list(columns)]
+
+
+def _arrow_schema(chunk):
+    # Schema suy từ khối dữ liệu thật đầu tiên (pandas 2.x suy cột object rỗng thành kiểu null);
+    # cột vẫn toàn giá trị thiếu trong khối đầu được ép về chuỗi để các khối sau mã hoá cùng kiểu
+    schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+    return pa.schema([
+        field.with_type(pa.large_string()) if pa.types.is_null(field.type) else field
+        for field in schema
+    ])
+
+
+def _with_schema(df, chunks, columns):
+    # Tách khối đầu để lấy schema rồi trả lại đủ các khối; không có dòng nào thì dùng bảng rỗng
+    first = next(chunks, None)
+    if first is None:
+        first = (df if columns is None else df[list(columns)]).iloc[:0]
+    return itertools.chain([first], chunks), _arrow_schema(first)
+
+
+def _write_csv(path, chunks, schema):
+    # Cột category (dictionary) ghi ra giá trị; BOM utf-8 để Excel mở đúng tiếng Việt
+    plain = pa.schema([
+        field.with_type(field.type.value_type) if pa.types.is_dictionary(field.type) else field
+        for field in schema
+    ])
+    with open(path, "wb") as f:
+        f.write(b"\xef\xbb\xbf")
+        with pa_csv.CSVWriter(f, plain) as writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False).cast(plain))
+
+
+def _write_parquet(path, chunks, schema):
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def _write_geojson(path, chunks, lat_col, lon_col):
+    # Dòng thiếu toạ độ hoặc chỉ có toạ độ tâm quận/huyện, tỉnh/thành (geocode.py) bị bỏ;
+    # các cột còn lại (gồm coord_source) thành properties, mã hoá bằng to_json (C) theo khối
+    first = True
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"type":"FeatureCollection","features":[')
+        for chunk in chunks:
+            lat = pd.to_numeric(chunk[lat_col], errors="coerce").to_numpy(dtype="float64")
+            lon = pd.to_numeric(chunk[lon_col], errors="coerce").to_numpy(dtype="float64")
+            valid = ~(np.isnan(lat) | np.isnan(lon)) & precise_rows(chunk)
+            if not valid.any():
+                continue
+            props = chunk.drop(columns=[lat_col, lon_col])[valid]
+            # lines=True: mỗi dòng một object; ký tự xuống dòng trong giá trị đã được escape
+            records = props.to_json(orient="records", lines=True, force_ascii=False, date_format="iso").splitlines()
+            features = ",".join(
+                f'{{"type":"Feature","geometry":{{"type":"Point","coordinates":[{x},{y}]}},"properties":{record}}}'
+                for x, y, record in zip(np.round(lon[valid], 6).tolist(), np.round(lat[valid], 6).tolist(), records)
+            )
+            f.write(features if first else "," + features)
+            first = False
+        f.write("]}")
+
+
+def export_key(name, selections, columns=None):
+    # Trạng thái bộ lọc + phiên bản dữ liệu: cùng khoá thì cùng nội dung file
+    active = sorted((col, str(value)) for col, value in selections.items() if value not in (None, "", ALL))
+    state = [EXPORT_VERSION, name, dataset_version(name), dataset_source_hash(name), active,
+             None if columns is None else list(columns)]
+    return hashlib.blake2b(json.dumps(state, ensure_ascii=False).encode("utf-8"), digest_size=12).hexdigest()
+
+
+def _prune(out_dir):
+    entries = [e for e in os.scandir(out_dir) if e.is_file() and not e.name.endswith(".tmp")]
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    for entry in entries[EXPORT_CACHE_FILES:]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def export_path(name, selections, fmt, columns=None, out_dir=EXPORT_DIR):
+    ext, _ = FORMATS[fmt]
+    return os.path.join(out_dir, f"{name}-{export_key(name, selections, columns)}{ext}")
+
+
+def export_file(name, df, rows, selections, fmt, columns=None, out_dir=EXPORT_DIR):
+    # Đường dẫn file đã mã hoá cho trạng thái lọc này; chỉ mã hoá khi chưa có trên đĩa
+    path = export_path(name, selections, fmt, columns, out_dir)
+    with _file_lock(path):
+        if os.path.exists(path):
+            cache_event("export", True)
+            os.utime(path)
+            return path
+        cache_event("export", False)
+
+        os.makedirs(out_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        total = len(df) if rows is None else len(rows)
+        with stage(f"export_{fmt.lower()}", rows_in=total) as perf:
+            chunks = _chunks(df, rows, columns)
+            if fmt == "CSV":
+                _write_csv(tmp_path, *_with_schema(df, chunks, columns))
+            elif fmt == "Parquet":
+                _write_parquet(tmp_path, *_with_schema(df, chunks, columns))
+            else:
+                _write_geojson(tmp_path, chunks, *COORDS[name])
+            os.replace(tmp_path, path)
+            perf["bytes"] = os.path.getsize(path)
+    _prune(out_dir)
+    return path
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _static_ready(path):
+    # File đã có và tải được qua static serving (trong giới hạn cỡ file)
+    if not st.get_option("server.enableStaticServing"):
+        return False
+    try:
+        return os.path.getsize(path) <= STATIC_MAX_BYTES
+    except OSError:
+        return False
+
+
+def render_export_buttons(name, df, rows, selections, key, columns=None):
+    # Khối tải dữ liệu của một trang: rows là vị trí dòng đã lọc (None = toàn bộ bảng)
+    with st.expander("⬇️ Tải dữ liệu đã lọc"):
+        fmt = st.radio("Định dạng:", options=list(FORMATS), horizontal=True, key=f"{key}_export_format")
+        ext, mime = FORMATS[fmt]
+        file_name = f"{name}{ext}"
+        total = len(df) if rows is None else len(rows)
+        st.caption(f"{total:,} dòng")
+        # Chỉ mã hoá (hoặc đọc file vào nút tải) khi người dùng yêu cầu; file của trạng thái lọc này
+        # đã có và tải được qua static serving thì hiện link ngay
+        if not _static_ready(export_path(name, selections, fmt, columns)) and \
+                not st.button("⚙️ Tạo file", key=f"{key}_export_build"):
+            return
+        try:
+            path = export_file(name, df, rows, selections, fmt, columns)
+            # _prune của phiên khác có thể xoá file ngay sau khi tạo: đọc cỡ/nội dung trong khối try
+            size = os.path.getsize(path)
+            data = None if _static_ready(path) else _read_file(path)
+        except Exception as e:
+            st.error(f"❌ Lỗi khi xuất dữ liệu: {e}")
+            return
+        label = f"📥 Tải {file_name} ({size / 1e6:.1f} MB)"
+        if data is None:
+            url = f"{EXPORT_URL}/{os.path.basename(path)}"
+            st.markdown(f'<a href="{url}" download="{file_name}">{label}</a>', unsafe_allow_html=True)
+        else:
+            st.download_button(label, data=data, file_name=file_name, mime=mime, key=f"{key}_export_download")
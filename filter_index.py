@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+from frame_cache import IdentityLRU
+
+ALL = "Tất cả"
+
+# Số chỉ mục giữ lại; mỗi chỉ mục ứng với một DataFrame gốc (đối tượng trả về từ data_loader)
+INDEX_CACHE_SIZE = 16
+# Số kết quả lọc giữ lại cho mỗi chỉ mục: cùng trạng thái bộ lọc trả về cùng một đối tượng,
+# nhờ đó các cache phía sau (bảng phân trang, bản đồ...) dùng lại được giữa các lần rerun
+SELECTION_CACHE_SIZE = 32
+
+_index_cache = IdentityLRU(INDEX_CACHE_SIZE, "filter_index")
+
+
+class FilterIndex:
+    def __init__(self, df, columns):
+        self.df = df
+        self.columns = tuple(columns)
+        self._categories = {}
+        self._order = {}
+        self._offsets = {}
+        self._options = {}
+        self._selections = IdentityLRU(SELECTION_CACHE_SIZE, "filter_select")
+        self._located = IdentityLRU(SELECTION_CACHE_SIZE, "filter_located")
+        for col in self.columns:
+            cat = pd.Categorical(df[col])
+            codes = cat.codes.astype(np.int64)
+            # Sắp xếp ổn định theo mã: vị trí các dòng của mỗi giá trị nằm liền nhau và tăng dần
+            order = np.argsort(codes, kind="stable")
+            counts = np.bincount(codes[codes >= 0], minlength=len(cat.categories))
+            missing = int((codes < 0).sum())
+            offsets = np.concatenate([[missing], missing + np.cumsum(counts)])
+            self._categories[col] = cat.categories
+            self._order[col] = order
+            self._offsets[col] = offsets
+            self._options[col] = sorted(cat.categories.tolist())
+
+    def options(self, column, include_all=True):
+        options = self._options[column]
+        return [ALL] + options if include_all else list(options)
+
+    def value_positions(self, column, value):
+        categories = self._categories[column]
+        try:
+            code = categories.get_loc(value)
+        except KeyError:
+            return np.empty(0, dtype=np.int64)
+        offsets = self._offsets[column]
+        return self._order[column][offsets[code]:offsets[code + 1]]
+
+    def positions(self, selections):
+        # None nghĩa là không lọc gì (toàn bộ bảng)
+        active = [
+            self.value_positions(col, value)
+            for col, value in selections.items()
+            if value is not None and value != ALL
+        ]
+        if not active:
+            return None
+        # Giao từ tập nhỏ nhất để chi phí bám theo kích thước kết quả
+        active.sort(key=len)
+        result = active[0]
+        for other in active[1:]:
+            if len(result) == 0:
+                break
+            # Cả hai mảng đều tăng dần: tìm nhị phân phần tử của tập nhỏ trong tập lớn
+            found = np.searchsorted(other, result)
+            found[found == len(other)] = 0
+            result = result[other[found] == result]
+        return result
+
+    def _selection_key(self, selections):
+        return tuple(sorted(
+            (col, value) for col, value in selections.items()
+            if value is not None and value != ALL
+        ))
+
+    def select(self, selections):
+        key = self._selection_key(selections)
+        if not key:
+            return self.df
+        return self._selections.get_or_build(key, lambda: self.df.iloc[self.positions(selections)])
+
+    def located(self, selections, lat_col="latitude", lon_col="longitude"):
+        # Các dòng đã lọc có đủ toạ độ, nhớ theo trạng thái bộ lọc như select(): bản đồ nhận
+        # cùng một đối tượng giữa các lần rerun nên payload của map4d nhớ theo đối tượng bảng
+        key = (self._selection_key(selections), lat_col, lon_col)
+        return self._located.get_or_build(key, lambda: self.select(selections).dropna(subset=[lat_col, lon_col]))
+
+
+def get_filter_index(df, columns):
+    return _index_cache.get_or_build(tuple(columns), lambda: FilterIndex(df, columns), frame=df)
@@ -0,0 +1,116 @@
+import threading
+import weakref
+from collections import OrderedDict, deque
+
+from instrumentation import cache_event
+
+# LRU dùng chung cho mọi cache trong tiến trình (chỉ mục lọc/không gian/tìm kiếm, khối tổng hợp,
+# trang bảng, payload bản đồ, figure...). Khi truyền frame, mục cache gắn với đúng đối tượng
+# DataFrame đó: khoá gồm id(frame), mục chỉ giữ tham chiếu yếu tới frame và lần tra sau so sánh `is`
+# nên id() bị tái sử dụng cũng không trả nhầm. Frame bị thu hồi thì mục của nó bị dọn ở lượt dùng
+# cache kế tiếp; bảng bị thay bởi phiên bản mới được gỡ chủ động qua release_frames.
+
+# Mọi cache đang sống, để release_frames gỡ mục của bảng cũ ở tất cả các nơi
+_caches = weakref.WeakSet()
+# Frame đã bị thay: id -> tham chiếu yếu. Rerun còn đang chạy trên bản cũ vẫn đọc được
+# nhưng không ghi thêm mục mới cho nó
+_released = {}
+_released_lock = threading.Lock()
+
+
+def _is_released(frame):
+    ref = _released.get(id(frame))
+    return ref is not None and ref() is frame
+
+
+def _forget_released(ref, key):
+    with _released_lock:
+        if _released.get(key) is ref:
+            del _released[key]
+
+
+def release_frames(*frames):
+    # Gỡ mọi mục gắn với các frame này (chỉ mục, khối tổng hợp, trang bảng...) ở mọi cache.
+    # Giá trị như FilterIndex/SearchIndex giữ tham chiếu mạnh tới bảng nên phải gỡ chủ động;
+    # các bảng con (kết quả lọc) được giải phóng theo, mục của chúng tự dọn nhờ tham chiếu yếu
+    frames = [frame for frame in frames if frame is not None]
+    with _released_lock:
+        for frame in frames:
+            key = id(frame)
+            _released[key] = weakref.ref(frame, lambda ref, key=key: _forget_released(ref, key))
+    for cache in list(_caches):
+        cache.discard_frames(frames)
+
+
+class IdentityLRU:
+    def __init__(self, maxsize, event):
+        # event: tên cache trong số liệu hit/miss (instrumentation.cache_event)
+        self.maxsize = maxsize
+        self.event = event
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Khoá của frame đã bị thu hồi; callback của weakref có thể chạy khi đang giữ _lock
+        # nên chỉ xếp hàng ở đây, việc xoá làm ở lượt dùng cache sau
+        self._dead = deque()
+        _caches.add(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _purge(self):
+        # Gọi khi đang giữ _lock
+        while self._dead:
+            full_key, ref = self._dead.popleft()
+            entry = self._entries.get(full_key)
+            if entry is not None and entry[0] is ref:
+                del self._entries[full_key]
+
+    def get(self, key, frame=None, event=None):
+        full_key = key if frame is None else (id(frame), key)
+        value = None
+        with self._lock:
+            self._purge()
+            entry = self._entries.get(full_key)
+            if entry is not None and (entry[0] is None if frame is None else entry[0]() is frame):
+                self._entries.move_to_end(full_key)
+                value = entry[1]
+        cache_event(event or self.event, value is not None)
+        return value
+
+    def put(self, key, value, frame=None):
+        if frame is None:
+            full_key, ref = key, None
+        elif _is_released(frame):
+            return value
+        else:
+            full_key = (id(frame), key)
+            ref = weakref.ref(frame, lambda ref: self._dead.append((full_key, ref)))
+        with self._lock:
+            self._purge()
+            self._entries[full_key] = (ref, value)
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def get_or_build(self, key, builder, frame=None, event=None):
+        # Dựng ngoài khoá: hai phiên cùng trượt cache có thể cùng dựng, bản sau ghi đè bản trước
+        value = self.get(key, frame, event)
+        if value is None:
+            value = self.put(key, builder(), frame)
+        return value
+
+    def discard_frames(self, frames):
+        with self._lock:
+            self._purge()
+            stale = [
+                full_key for full_key, (ref, _) in self._entries.items()
+                if ref is not None and any(ref() is frame for frame in frames)
+            ]
+            for full_key in stale:
+                del self._entries[full_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dead.clear()
@@ -0,0 +1,259 @@
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from data_loader import dataset_path, dataset_source_hash, dataset_version, load_dataset, read_dataset, source_hash
+
+# Điền toạ độ còn thiếu từ một gazetteer dựng tại chỗ: tâm (trung vị) toạ độ của các dòng đã có
+# toạ độ ở cùng phường/xã (mã địa chỉ hoặc tên), rồi quận/huyện, rồi tỉnh/thành.
+# Chạy hoàn toàn offline: python geocode.py [--datasets banking retail]
+
+# Tăng khi đổi cách dựng gazetteer để bản đã lưu tự bị bỏ qua
+GEOCODE_VERSION = "1"
+SOURCE_COLUMN = "coord_source"
+ORIGINAL = "original"
+
+# Các mức tra cứu từ chính xác nhất tới thô nhất: (nhãn nguồn, cột khoá)
+LEVELS = [
+    ("address_code", ["address_code"]),
+    ("ward", ["ward_commune", "district", "city"]),
+    ("district", ["district", "city"]),
+    ("city", ["city"]),
+]
+SOURCES = [ORIGINAL] + [label for label, _ in LEVELS]
+# Mức điền chỉ là tâm cả quận/huyện hay tỉnh/thành (sai số hàng km tới hàng chục km):
+# không dùng làm vị trí trong truy vấn khoảng cách/lân cận hay hình học GeoJSON
+COARSE_SOURCES = ["district", "city"]
+
+# Các bảng có cột địa giới hành chính: vừa làm nguồn gazetteer vừa được điền toạ độ
+GEOCODE_DATASETS = ["banking", "retail", "industry"]
+LAT_COL = "latitude"
+LON_COL = "longitude"
+
+
+def precise_rows(df):
+    # Mặt nạ các dòng có toạ độ đủ chính xác cho truy vấn không gian; bảng chưa điền: mọi dòng
+    if SOURCE_COLUMN not in df.columns:
+        return np.ones(len(df), dtype=bool)
+    return ~df[SOURCE_COLUMN].isin(COARSE_SOURCES).to_numpy(dtype=bool)
+
+
+def geocoded_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".geocoded.feather"
+
+
+def _key_values(df, col):
+    if col == "address_code":
+        # Cùng một mã phường được lưu là "06952", 6952 hoặc category tuỳ bảng
+        return pd.to_numeric(df[col].astype("string"), errors="coerce").astype("Int64")
+    # Chuẩn hoá trên tập giá trị khác nhau (vài nghìn) rồi trải lại theo mã, không xử lý chuỗi từng dòng
+    codes, uniques = pd.factorize(df[col])
+    normalized = pd.Index(uniques.astype(str)).str.strip().str.lower().str.replace(r"\s+", " ", regex=True)
+    values = np.asarray(normalized, dtype=object).take(codes)
+    values[codes < 0] = None
+    return pd.Series(values, index=df.index)
+
+
+def _level_codes(frames, columns):
+    # Mã nguyên chung cho khoá nhiều cột trên mọi bảng (-1: thiếu một thành phần khoá);
+    # nối bảng bằng mã này thay cho merge trên chuỗi
+    sizes = [len(f) for f in frames]
+    combined = None
+    for col in columns:
+        values = pd.concat([_key_values(f, col) for f in frames], ignore_index=True)
+        codes, uniques = pd.factorize(values)
+        codes = codes.astype(np.int64)
+        if combined is None:
+            combined = codes
+        else:
+            combined = np.where((combined < 0) | (codes < 0), -1, combined * (len(uniques) + 1) + codes)
+    codes, _ = pd.factorize(combined)
+    codes[combined < 0] = -1
+    return np.split(codes, np.cumsum(sizes)[:-1])
+
+
+def _centroids(codes, lat, lon, n_keys):
+    # Trung vị theo khoá: ít bị kéo lệch bởi vài toạ độ nhập sai hơn trung bình.
+    # Khoá không có dòng nào có toạ độ giữ NaN
+    valid = codes >= 0
+    grouped = pd.DataFrame({"lat": lat[valid], "lon": lon[valid]}).groupby(codes[valid])
+    medians = grouped.median()
+    c_lat = np.full(n_keys, np.nan)
+    c_lon = np.full(n_keys, np.nan)
+    c_lat[medians.index] = medians["lat"].to_numpy()
+    c_lon[medians.index] = medians["lon"].to_numpy()
+    return c_lat, c_lon
+
+
+def backfill(targets, references=None):
+    # targets: {tên: DataFrame}; references: danh sách bảng làm gazetteer (mặc định chính targets).
+    # Trả về {tên: DataFrame đã điền} với cột coord_source cho biết toạ độ lấy từ đâu.
+    names = list(targets)
+    frames = [targets[name] for name in names]
+    references = list(references) if references is not None else list(frames)
+    # Bảng vừa là nguồn vừa là đích chỉ được mã hoá khoá một lần
+    all_frames = list(references)
+    positions = []
+    for f in frames:
+        same = [i for i, r in enumerate(all_frames) if r is f]
+        if not same:
+            all_frames.append(f)
+        positions.append(same[0] if same else len(all_frames) - 1)
+
+    ref_lat = np.concatenate([pd.to_numeric(f[LAT_COL], errors="coerce").to_numpy(dtype="float64") for f in references])
+    ref_lon = np.concatenate([pd.to_numeric(f[LON_COL], errors="coerce").to_numpy(dtype="float64") for f in references])
+    ref_known = ~(np.isnan(ref_lat) | np.isnan(ref_lon))
+    # Toạ độ do chính bước này điền trước đó không được dùng làm gazetteer
+    ref_original = np.concatenate([
+        (f[SOURCE_COLUMN] == ORIGINAL).to_numpy(dtype=bool) if SOURCE_COLUMN in f.columns else np.ones(len(f), dtype=bool)
+        for f in references
+    ])
+    ref_known &= ref_original
+
+    # copy: cột float có thể là view chỉ đọc trên snapshot memory-map
+    lat = [pd.to_numeric(f[LAT_COL], errors="coerce").to_numpy(dtype="float64", copy=True) for f in frames]
+    lon = [pd.to_numeric(f[LON_COL], errors="coerce").to_numpy(dtype="float64", copy=True) for f in frames]
+    source = [np.where(np.isnan(la) | np.isnan(lo), -1, 0).astype(np.int8) for la, lo in zip(lat, lon)]
+
+    for level, (_, columns) in enumerate(LEVELS, start=1):
+        if not all(col in f.columns for f in all_frames for col in columns):
+            continue
+        codes = _level_codes(all_frames, columns)
+        ref_codes = np.concatenate(codes[:len(references)])
+        n_keys = max((int(c.max()) + 1 for c in codes if len(c)), default=0)
+        c_lat, c_lon = _centroids(np.where(ref_known, ref_codes, -1), ref_lat, ref_lon, n_keys)
+        for i, target_codes in enumerate(codes[p] for p in positions):
+            todo = np.flatnonzero((source[i] < 0) & (target_codes >= 0))
+            if not len(todo):
+                continue
+            found_lat = c_lat[target_codes[todo]]
+            found = ~np.isnan(found_lat)
+            rows = todo[found]
+            lat[i][rows] = found_lat[found]
+            lon[i][rows] = c_lon[target_codes[rows]]
+            source[i][rows] = level
+
+    results = {}
+    for i, name in enumerate(names):
+        df = frames[i].copy(deep=False)
+        df[LAT_COL] = lat[i].astype(df[LAT_COL].dtype if df[LAT_COL].dtype.kind == "f" else "float64")
+        df[LON_COL] = lon[i].astype(df[LON_COL].dtype if df[LON_COL].dtype.kind == "f" else "float64")
+        df[SOURCE_COLUMN] = pd.Categorical.from_codes(source[i], categories=SOURCES)
+        results[name] = df
+    return results
+
+
+def _output_key(source):
+    return f"{GEOCODE_VERSION}:{source}".encode()
+
+
+def write_output(name, df, source):
+    path = geocoded_path(dataset_path(name))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"trade_streamlit.geocode"] = _output_key(source)
+    feather.write_feather(table.replace_schema_metadata(metadata), tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_output(name, source):
+    # Bảng đã điền toạ độ nếu được dựng từ đúng phiên bản file nguồn, ngược lại None
+    path = geocoded_path(dataset_path(name))
+    if not os.path.exists(path):
+        return None
+    try:
+        with pa.memory_map(path, "r") as f:
+            table = pa.ipc.open_file(f).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+    if (table.schema.metadata or {}).get(b"trade_streamlit.geocode") != _output_key(source):
+        return None
+    return table.to_pandas(split_blocks=True)
+
+
+def has_output(name):
+    return name in GEOCODE_DATASETS and os.path.exists(geocoded_path(dataset_path(name)))
+
+
+def output_stat(name):
+    # (mtime, kích thước) của bản đã điền toạ độ; () khi bảng chưa được điền
+    if name not in GEOCODE_DATASETS:
+        return ()
+    try:
+        stat = os.stat(geocoded_path(dataset_path(name)))
+    except FileNotFoundError:
+        return ()
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def served_source(name, source):
+    # Nhãn nội dung của bảng được phục vụ: hash file nguồn, cộng phiên bản gazetteer và bản đã điền
+    # toạ độ khi có (điền lại với gazetteer mới thì đổi dù file nguồn không đổi)
+    output = output_stat(name)
+    if not output:
+        return source
+    return hashlib.sha1(f"{source}:{GEOCODE_VERSION}:{output[0]}:{output[1]}".encode()).hexdigest()
+
+
+def apply_output(name, df, source):
+    # Bảng trang sẽ thấy và nhãn nội dung của nó: bản đã điền toạ độ nếu đã bật (python geocode.py)
+    if has_output(name):
+        df = refresh_output(name, df, source)
+    return df, served_source(name, source)
+
+
+def served_dataset(name):
+    # Cho công cụ dòng lệnh (tile_export.py): cùng bảng và nhãn với bản refresher.py công bố
+    if dataset_version(name):
+        return load_dataset(name), dataset_source_hash(name)
+    df = read_dataset(name)
+    return apply_output(name, df, source_hash(dataset_path(name)))
+
+
+def refresh_output(name, df, source):
+    # Dùng cho refresher.py: trả bản đã lưu nếu còn mới, ngược lại điền lại cho df với gazetteer
+    # từ df và các bảng còn lại (bản đang công bố) rồi lưu
+    cached = read_output(name, source)
+    if cached is not None:
+        return cached
+    # wait=False: chạy trong luồng khởi động, không chờ bảng khác đang được dựng song song
+    references = [df] + [load_dataset(other, wait=False) for other in GEOCODE_DATASETS if other != name]
+    filled = backfill({name: df}, references)[name]
+    write_output(name, filled, source)
+    return filled
+
+
+def run(names=GEOCODE_DATASETS):
+    frames = {name: load_dataset(name) for name in GEOCODE_DATASETS}
+    filled = backfill({name: frames[name] for name in names}, list(frames.values()))
+    for name in names:
+        write_output(name, filled[name], source_hash(dataset_path(name)))
+    return filled
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Điền toạ độ còn thiếu từ gazetteer dựng tại chỗ")
+    parser.add_argument("--datasets", nargs="+", choices=GEOCODE_DATASETS, default=GEOCODE_DATASETS)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    filled = run(args.datasets)
+    print(f"Xong trong {time.perf_counter() - start:.2f}s")
+    for name, df in filled.items():
+        counts = df[SOURCE_COLUMN].value_counts(dropna=False)
+        summary = ", ".join(f"{source}: {count}" for source, count in counts.items())
+        print(f"{name:10} {len(df):8d} dòng  {summary}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,55 +1,24 @@
 import streamlit as st
-import pandas as pd
-import os
-from dotenv import load_dotenv
+from data_loader import load_dataset
+from instrumentation import stage
+from map4d import density_mode, map4d_credentials, render_map4d
+from tile_export import tile_source
+from filter_index import get_filter_index
+from paged_table import render_paged_table
+from exports import render_export_buttons
+from spatial_index import get_spatial_index
+from geocode import SOURCE_COLUMN, precise_rows
 
 if __name__ == "__main__":
     st.set_page_config(page_title="Bản đồ Khu công nghiệp", layout="wide")
 
-load_dotenv()
-# MAP4D_API_KEY = os.getenv("MAP4D_API_KEY")
-# MAP4D_MAP_ID = os.getenv("MAP4D_MAP_ID", "")
-
-MAP4D_API_KEY = st.secrets.get("MAP4D_API_KEY") or os.getenv("MAP4D_API_KEY")
-MAP4D_MAP_ID = st.secrets.get("MAP4D_MAP_ID") or os.getenv("MAP4D_MAP_ID", "")
-
-def render_map4d(df, api_key, map_id=""):
-    template_path = os.path.join(os.path.dirname(__file__), "map4d_template.html")
-    if not os.path.exists(template_path):
-        st.error("❌ Không tìm thấy file map4d_template.html!")
-        return
-
-    with open(template_path, "r", encoding="utf-8") as f:
-        html_template = f.read()
-
-    marker_js = ""
-    for _, row in df.iterrows():
-        try:
-            lat = float(row['latitude'])
-            lng = float(row['longitude'])
-        except Exception:
-            continue
-
-        marker_js += f"""
-        new map4d.Marker({{
-            position: {{ lat: {lat}, lng: {lng} }},
-            title: "{row['name']}"
-        }}).setMap(map);
-        """
-    html_content = (
-        html_template
-        .replace("##MARKERS_PLACEHOLDER##", marker_js)
-        .replace("__API_KEY__", api_key)
-        .replace("__MAP_ID__", map_id or "")
-    )
-    st.components.v1.html(html_content, height=800)
-
 def main():
     st.title("🏭 Bản đồ Khu công nghiệp")
 
-    file_path = os.path.join(os.path.dirname(__file__), "kcn.csv")
     try:
-        df = pd.read_csv(file_path)
+        with stage("load") as perf:
+            df = load_dataset("industry")
+            perf["rows_out"] = len(df)
     except Exception as e:
         st.error(f"❌ Lỗi khi đọc file CSV: {e}")
         return
@@ -57,21 +26,22 @@ def main():
     st.write("### Dữ liệu gốc:")
     st.dataframe(df.head(10))
 
-    city_options = ['Tất cả'] + sorted(df['city'].dropna().unique().tolist())
-    investor_options = ['Tất cả'] + sorted(df['investor'].dropna().unique().tolist())
+    filters = get_filter_index(df, ['city', 'investor'])
+    city_options = filters.options('city')
+    investor_options = filters.options('investor')
 
     st.sidebar.header("Bộ lọc Khu công nghiệp")
     selected_city = st.sidebar.selectbox("Chọn thành phố:", options=city_options, key="industry_city_filter")
     selected_investor = st.sidebar.selectbox("Chọn investor:", options=investor_options, key="industry_investor_filter")
 
-    filtered_df = df.copy()
-    if selected_city != "Tất cả":
-        filtered_df = filtered_df[filtered_df['city'] == selected_city]
-    if selected_investor != "Tất cả":
-        filtered_df = filtered_df[filtered_df['investor'] == selected_investor]
+    selections = {'city': selected_city, 'investor': selected_investor}
+    with stage("filter", rows_in=len(df)) as perf:
+        filtered_df = filters.select(selections)
+        perf["rows_out"] = len(filtered_df)
 
     st.write(f"### Dữ liệu đã lọc (số dòng: {filtered_df.shape[0]}):")
-    st.dataframe(filtered_df[['id', 'name', 'investor', 'address', 'city', 'latitude', 'longitude']])
+    render_paged_table(filtered_df, key="industry_filtered_table", columns=['id', 'name', 'investor', 'address', 'city', 'latitude', 'longitude'])
+    render_export_buttons("industry", df, filters.positions(selections), selections, key="industry")
 
     with st.expander("Xem phân tích dữ liệu tọa độ"):
         total_rows = filtered_df.shape[0]
@@ -92,7 +62,40 @@ def main():
             st.write("Số KCN thiếu tọa độ theo investor:")
             st.dataframe(missing_by_investor)
 
-    map_df = filtered_df.dropna(subset=["latitude", "longitude"])
+        if 'coord_source' in filtered_df.columns:
+            st.write("Nguồn tọa độ (điền từ gazetteer theo mã địa chỉ/phường/quận/tỉnh):")
+            st.dataframe(filtered_df['coord_source'].value_counts().rename_axis('coord_source').reset_index(name='count'))
+
+    map_df = filters.located(selections)
+
+    with st.expander("🔎 Ngân hàng và cửa hàng bán lẻ gần KCN"):
+        # KCN chỉ có toạ độ tâm quận/huyện, tỉnh/thành (điền từ gazetteer) không dùng làm tâm tìm kiếm
+        nearby_df = map_df[precise_rows(map_df)]
+        park_options = nearby_df['name'].dropna().unique().tolist()
+        if not park_options:
+            st.info("Không có KCN nào có tọa độ chính xác trong bộ lọc hiện tại.")
+        else:
+            park_name = st.selectbox("Chọn KCN:", options=park_options, key="industry_nearby_park")
+            radius_km = st.slider("Bán kính (km):", min_value=1, max_value=50, value=5, key="industry_nearby_radius")
+            park = nearby_df[nearby_df['name'] == park_name].iloc[0]
+            for label, dataset, columns in [
+                ("Ngân hàng", "banking", ['bank', 'name', 'type', 'address', 'city']),
+                ("Cửa hàng bán lẻ", "retail", ['retail_chain', 'name', 'type', 'address', 'city']),
+            ]:
+                try:
+                    other = load_dataset(dataset)
+                except Exception as e:
+                    st.error(f"❌ Lỗi khi đọc dữ liệu {label.lower()}: {e}")
+                    continue
+                with stage(f"nearby:{dataset}", rows_in=len(other)) as perf:
+                    rows, dist = get_spatial_index(other).within(park['latitude'], park['longitude'], radius_km)
+                    perf["rows_out"] = len(rows)
+                if SOURCE_COLUMN in other.columns:
+                    # Toạ độ điền theo mã địa chỉ/phường vẫn là gần đúng: hiện nguồn toạ độ cạnh khoảng cách
+                    columns = columns + [SOURCE_COLUMN]
+                nearby = other.iloc[rows][columns].assign(distance_km=dist.round(2))
+                st.write(f"{label} trong bán kính {radius_km} km: {len(nearby)}")
+                st.dataframe(nearby)
 
     if "map_visible_industry" not in st.session_state:
         st.session_state.map_visible_industry = False
@@ -100,10 +103,12 @@ def main():
         st.session_state.map_visible_industry = not st.session_state.map_visible_industry
 
     if st.session_state.map_visible_industry:
-        if not MAP4D_API_KEY:
+        api_key, map_id = map4d_credentials()
+        if not api_key:
             st.warning("⚠️ Vui lòng cấu hình MAP4D_API_KEY trong phần Secrets của Streamlit")
         else:
-            render_map4d(map_df, api_key=MAP4D_API_KEY, map_id=MAP4D_MAP_ID)
+            render_map4d(map_df, api_key=api_key, map_id=map_id, tiles=tile_source("industry", selections),
+                         hexbin=density_mode("industry_map_mode"))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Chuẩn hoá một lần khi nạp dữ liệu; kết quả được data_loader lưu vào snapshot
+# nên các trang chỉ nhận bảng đã sẵn sàng để vẽ.
+
+NUMBER_PATTERN = r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$"
+
+POWERPLANT_CATEGORIES = ['type', 'sub_type', 'province', 'river']
+
+# Thứ tự ưu tiên giống extract_plant_type cũ: khớp từ khoá đầu tiên
+PLANT_TYPE_KEYWORDS = [
+    ("mặt trời", "Điện mặt trời"),
+    ("gió", "Điện gió"),
+    ("thuỷ", "Thuỷ điện"),
+]
+
+
+def classify_plant_type(types):
+    # Ít giá trị khác nhau: phân loại từng giá trị duy nhất rồi ánh xạ lại theo mã
+    codes, uniques = pd.factorize(types)
+    lower = pd.Series(uniques, dtype="string").str.lower()
+    conditions = [lower.str.contains(keyword, regex=False, na=False).to_numpy() for keyword, _ in PLANT_TYPE_KEYWORDS]
+    labels = [label for _, label in PLANT_TYPE_KEYWORDS]
+    classified = np.select(conditions, labels, default=np.asarray(uniques, dtype=object))
+    result = np.take(np.append(classified, None).astype(object), codes)
+    return pd.Series(result, index=types.index)
+
+
+def _to_float32(values):
+    values = pc.utf8_trim_whitespace(values)
+    # Chuỗi không phải số thành null thay vì làm cast báo lỗi (giống errors='coerce')
+    valid = pc.fill_null(pc.match_substring_regex(values, NUMBER_PATTERN), False)
+    values = pc.if_else(valid, values, pa.scalar(None, pa.string()))
+    return pc.cast(values, pa.float32()).to_numpy(zero_copy_only=False)
+
+
+def parse_latlng(latlng):
+    # "lat, lon" (có thể kèm dấu nháy) -> hai cột float32; dòng lỗi thành NaN
+    values = pa.array(latlng, type=pa.string(), from_pandas=True)
+    parts = pc.split_pattern(pc.replace_substring(values, '"', ''), ',')
+    # Chỉ nhận đúng hai phần; lấy trực tiếp theo offsets của mảng list đã làm phẳng
+    ok = pc.fill_null(pc.equal(pc.list_value_length(parts), 2), False).to_numpy(zero_copy_only=False)
+    starts = parts.offsets.to_numpy()[:-1][ok]
+    flat = parts.values
+    lat = np.full(len(values), np.nan, dtype='float32')
+    lon = np.full(len(values), np.nan, dtype='float32')
+    lat[ok] = _to_float32(flat.take(pa.array(starts)))
+    lon[ok] = _to_float32(flat.take(pa.array(starts + 1)))
+    return pd.Series(lat, index=latlng.index), pd.Series(lon, index=latlng.index)
+
+
+def prepare_powerplant(raw):
+    for col, message in [
+        ('latlng', "Không tìm thấy cột 'latlng' trong dữ liệu!"),
+        ('sub_type', "Không tìm thấy cột 'sub_type' trong dữ liệu!"),
+        ('Column1', "Không tìm thấy cột 'Column1' chứa tên nhà máy!"),
+    ]:
+        if col not in raw.columns:
+            raise ValueError(message)
+
+    df = raw.dropna(subset=['latlng'])
+    lat, lon = parse_latlng(df['latlng'])
+    valid = (lat.notna() & lon.notna()).to_numpy()
+    df = df.loc[valid].drop(columns=['latlng']).rename(columns={'Column1': 'name'})
+    df['lat'] = lat[valid]
+    df['lon'] = lon[valid]
+
+    # sub_type trống hoặc 'None' lấy theo type gốc (trước khi phân loại lại)
+    sub_type = df['sub_type']
+    df['sub_type'] = sub_type.mask(sub_type.isna() | (sub_type == 'None'), df['type'])
+    df['type'] = classify_plant_type(df['type'])
+    df['capacity'] = pd.to_numeric(df['capacity'], errors='coerce')
+
+    for col in POWERPLANT_CATEGORIES:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df.reset_index(drop=True)
+
+
+# Lược đồ kiểu dữ liệu: cột lặp lại nhiều -> category, mã -> số nguyên nhỏ (nullable),
+# toạ độ -> float32, văn bản tự do -> chuỗi lưu bằng pyarrow
+TEXT = 'string[pyarrow]'
+
+BANKING_SCHEMA = {
+    'id': 'Int32',
+    'bank': 'category',
+    'bank_name': 'category',
+    'bank_code': 'Int8',
+    'name': TEXT,
+    'type': 'category',
+    'address': TEXT,
+    'address_code': 'category',
+    'status': 'Int8',
+    'ward_commune': 'category',
+    'district': 'category',
+    'city': 'category',
+    'type_ward': 'category',
+    'type_district': 'category',
+    'type_city': 'category',
+    'city_code': 'category',
+    'economic_zone': 'category',
+    'mark': 'category',
+    'latitude': 'float32',
+    'longitude': 'float32',
+}
+
+RETAIL_SCHEMA = {
+    'id': 'Int32',
+    'retail_chain': 'category',
+    'name': TEXT,
+    'type': 'category',
+    'address': TEXT,
+    'address_code': 'Int32',
+    'status': 'Int8',
+    'ward_commune': 'category',
+    'district': 'category',
+    'city': 'category',
+    'type_ward': 'category',
+    'type_district': 'category',
+    'type_city': 'category',
+    'city_code': 'Int8',
+    'economic_zone': 'category',
+    'latitude': 'float32',
+    'longitude': 'float32',
+}
+
+
+def apply_schema(df, schema):
+    df = df.copy(deep=False)
+    for col, dtype in schema.items():
+        if col not in df.columns:
+            continue
+        if dtype.startswith('Int') or dtype.startswith('float'):
+            # Giá trị không phải số thành thiếu thay vì làm hỏng cả lần nạp
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def prepare_banking(raw):
+    return apply_schema(raw, BANKING_SCHEMA)
+
+
+def prepare_retail(raw):
+    return apply_schema(raw, RETAIL_SCHEMA)
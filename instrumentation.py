@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+# Đo thời gian/bộ nhớ từng giai đoạn trong một lần rerun, đếm cache hit/miss,
+# ghi log có cấu trúc và cấp dữ liệu cho bảng debug ở sidebar.
+# Cấu hình cấp tiến trình (biến môi trường hoặc file .env, đọc một lần khi app khởi động):
+#   PERF_LOG_LEVEL=INFO|WARNING|...  cấp log của "trade_streamlit.*" ra stderr; mặc định INFO,
+#                                    mỗi lần rerun ghi một dòng JSON trên "trade_streamlit.perf"
+#   PERF_TRACE_MEMORY=1              bật tracemalloc cho cả tiến trình (chậm hơn) để đo đỉnh bộ nhớ
+#                                    từng giai đoạn
+
+logger = logging.getLogger("trade_streamlit.perf")
+LOG_FORMAT = "%(asctime)s %(name)s %(levelname)s %(message)s"
+
+# Mỗi phiên Streamlit chạy script trong luồng riêng: lần rerun hiện tại lưu theo luồng
+_local = threading.local()
+_totals = {}
+_lock = threading.Lock()
+_configured = False
+
+
+def configure():
+    # Gọi một lần ở app.py; các lần sau (mỗi rerun) không làm gì
+    global _configured
+    with _lock:
+        if _configured:
+            return
+        _configured = True
+    load_dotenv()
+    level = logging.getLevelName(os.getenv("PERF_LOG_LEVEL", "INFO").upper())
+    root = logging.getLogger("trade_streamlit")
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+        root.propagate = False
+    root.setLevel(level if isinstance(level, int) else logging.INFO)
+    if os.getenv("PERF_TRACE_MEMORY", "").lower() in ("1", "true", "yes") and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def memory_tracing():
+    return tracemalloc.is_tracing()
+
+
+def start_run(page):
+    _local.run = {"page": page, "started": time.perf_counter(), "stages": [], "cache": {}}
+    return _local.run
+
+
+def current_run():
+    return getattr(_local, "run", None)
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    # Giá trị yield là dict; bên trong có thể gán rows_out, bytes...
+    # mem_peak_bytes chỉ là gần đúng: tracemalloc đo chung cả tiến trình nên đỉnh gồm cấp phát của
+    # phiên khác chạy cùng lúc, và reset_peak của stage này (hay của phiên khác) làm hụt đỉnh của
+    # stage đang chạy song song hoặc bao ngoài
+    info = {"stage": name, "rows_in": rows_in, "rows_out": None, "bytes": None}
+    tracing = tracemalloc.is_tracing() and hasattr(tracemalloc, "reset_peak")
+    if tracing:
+        tracemalloc.reset_peak()
+        mem_start = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        info["seconds"] = time.perf_counter() - start
+        if tracing:
+            info["mem_peak_bytes"] = tracemalloc.get_traced_memory()[1] - mem_start
+        run = current_run()
+        if run is not None:
+            run["stages"].append(info)
+
+
+def cache_event(cache, hit):
+    field = "hit" if hit else "miss"
+    with _lock:
+        counts = _totals.setdefault(cache, {"hit": 0, "miss": 0})
+        counts[field] += 1
+    run = current_run()
+    if run is not None:
+        counts = run["cache"].setdefault(cache, {"hit": 0, "miss": 0})
+        counts[field] += 1
+
+
+def cache_totals():
+    with _lock:
+        return {cache: dict(counts) for cache, counts in _totals.items()}
+
+
+def finish_run():
+    run = current_run()
+    if run is None:
+        return None
+    run["seconds"] = time.perf_counter() - run["started"]
+    if logger.isEnabledFor(logging.INFO):
+        record = {key: value for key, value in run.items() if key != "started"}
+        logger.info(json.dumps(record, ensure_ascii=False, default=str))
+    return run
+
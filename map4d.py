@@ -0,0 +1,236 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from dotenv import load_dotenv
+
+from frame_cache import IdentityLRU
+from instrumentation import stage
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "map4d_template.html")
+
+# Số payload giữ lại trong cache (mỗi payload ứng với một tập điểm đã lọc)
+PAYLOAD_CACHE_SIZE = 32
+
+# Từ số điểm này trở lên thì tự bật chế độ gom cụm
+CLUSTER_THRESHOLD = 1000
+# Kích thước ô lưới gom cụm (pixel trên màn hình) và mức zoom cao nhất còn gom cụm
+CLUSTER_CELL_PX = 60
+CLUSTER_MAX_ZOOM = 16
+TILE_SIZE = 256
+# Chế độ mật độ: bán kính ô lục giác (pixel trên màn hình) và mức zoom cao nhất được tính sẵn
+HEXBIN_SIZE_PX = 24
+HEXBIN_MAX_ZOOM = 13
+MAP_MODES = ["Điểm", "Mật độ (lục giác)"]
+
+_payload_cache = IdentityLRU(PAYLOAD_CACHE_SIZE, "map")
+_template_cache = {}
+_dotenv_loaded = False
+
+
+def load_template():
+    mtime = os.stat(TEMPLATE_PATH).st_mtime_ns
+    cached = _template_cache.get("template")
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(TEMPLATE_PATH, "r", encoding="utf-8") as f:
+        html_template = f.read()
+    _template_cache["template"] = (mtime, html_template)
+    return html_template
+
+
+def density_mode(key):
+    # Lựa chọn ở sidebar: vẽ từng điểm hay bản đồ mật độ ô lục giác
+    choice = st.sidebar.radio("Kiểu hiển thị bản đồ:", options=MAP_MODES, key=key, horizontal=True)
+    return choice == MAP_MODES[1]
+
+
+def map4d_credentials():
+    # Chỉ đọc .env và st.secrets khi cần vẽ bản đồ: lần truy cập secrets đầu tiên mất vài trăm ms
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        load_dotenv()
+        _dotenv_loaded = True
+    try:
+        api_key = st.secrets.get("MAP4D_API_KEY")
+        map_id = st.secrets.get("MAP4D_MAP_ID")
+    except FileNotFoundError:
+        # Chưa có secrets.toml: dùng biến môi trường
+        api_key = map_id = None
+    return api_key or os.getenv("MAP4D_API_KEY"), map_id or os.getenv("MAP4D_MAP_ID", "")
+
+
+def _memoize(kind, df, lat_col, lon_col, name_col, builder):
+    # Nhớ theo đối tượng bảng: trang truyền bảng lấy từ FilterIndex.located() nên cùng trạng thái
+    # bộ lọc là cùng một đối tượng, không phải băm lại nội dung ở mỗi lần rerun
+    return _payload_cache.get_or_build((kind, lat_col, lon_col, name_col), builder, frame=df, event=f"map_{kind}")
+
+
+def _to_script_json(obj):
+    payload = json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+    # Tránh tên chứa "</script>" làm đóng thẻ script sớm
+    return payload.replace("</", "<\\/")
+
+
+def _valid_points(df, lat_col, lon_col, name_col):
+    lat = pd.to_numeric(df[lat_col], errors="coerce")
+    lon = pd.to_numeric(df[lon_col], errors="coerce")
+    valid = lat.notna() & lon.notna()
+    names = df.loc[valid, name_col].fillna("").astype(str)
+    return lat[valid].to_numpy(dtype="float64"), lon[valid].to_numpy(dtype="float64"), names
+
+
+def build_points_json(df, lat_col="latitude", lon_col="longitude", name_col="name"):
+    def build():
+        lat, lon, names = _valid_points(df, lat_col, lon_col, name_col)
+        # Mảng gọn [[lat, lng, title], ...]; json.dumps xử lý dấu nháy trong tên
+        points = list(zip(np.round(lat, 7).tolist(), np.round(lon, 7).tolist(), names.tolist()))
+        return _to_script_json(points)
+
+    return _memoize("points", df, lat_col, lon_col, name_col, build)
+
+
+def mercator(lat, lon):
+    # Toạ độ Web Mercator chuẩn hoá về [0, 1)
+    x = (lon + 180.0) / 360.0
+    sin_lat = np.sin(np.radians(np.clip(lat, -85.05112878, 85.05112878)))
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)
+    return np.clip(x, 0.0, 1.0 - 1e-12), np.clip(y, 0.0, 1.0 - 1e-12)
+
+
+def build_cluster_index(lat, lon, cell_px=CLUSTER_CELL_PX, max_zoom=CLUSTER_MAX_ZOOM):
+    # Gom điểm theo lưới pixel cho từng mức zoom 0..max_zoom.
+    # Mỗi mức: {"c": [[lat, lng, count], ...], "p": [chỉ số điểm đơn lẻ, ...]}.
+    # Khi mọi ô chỉ còn một điểm thì dừng: từ mức đó trở lên client vẽ điểm gốc.
+    x, y = mercator(lat, lon)
+    levels = []
+    for zoom in range(max_zoom + 1):
+        cells = float(TILE_SIZE * 2 ** zoom) / cell_px
+        cell_x = (x * cells).astype(np.int64)
+        cell_y = (y * cells).astype(np.int64)
+        cell_id = cell_x * (int(cells) + 1) + cell_y
+        _, inverse, counts = np.unique(cell_id, return_inverse=True, return_counts=True)
+        if counts.max(initial=0) <= 1:
+            break
+
+        # Tâm cụm là trung bình toạ độ các điểm trong ô
+        lat_mean = np.bincount(inverse, weights=lat) / counts
+        lon_mean = np.bincount(inverse, weights=lon) / counts
+        multi = counts > 1
+        singles = np.flatnonzero(~multi[inverse])
+        clusters = np.column_stack([np.round(lat_mean[multi], 6), np.round(lon_mean[multi], 6), counts[multi]])
+        levels.append({
+            "c": [[la, lo, int(n)] for la, lo, n in clusters.tolist()],
+            "p": singles.tolist(),
+        })
+    return levels
+
+
+def build_cluster_json(df, lat_col="latitude", lon_col="longitude", name_col="name"):
+    def build():
+        lat, lon, _ = _valid_points(df, lat_col, lon_col, name_col)
+        return _to_script_json(build_cluster_index(lat, lon))
+
+    return _memoize("clusters", df, lat_col, lon_col, name_col, build)
+
+
+def build_hexbin_index(lat, lon, size_px=HEXBIN_SIZE_PX, max_zoom=HEXBIN_MAX_ZOOM):
+    # Đếm điểm theo ô lục giác (đỉnh nhọn) trong không gian pixel Web Mercator cho từng mức zoom.
+    # Mỗi mức: {"m": số điểm lớn nhất một ô, "c": [[lat, lng, count], ...]} với (lat, lng) là tâm ô.
+    # Dừng khi mọi ô chỉ còn một điểm: zoom sâu hơn client dùng lại mức cuối.
+    x, y = mercator(lat, lon)
+    levels = []
+    for zoom in range(max_zoom + 1):
+        world = float(TILE_SIZE * 2 ** zoom)
+        px, py = x * world, y * world
+        # Toạ độ trục (q, r) rồi làm tròn theo toạ độ khối
+        q = (np.sqrt(3) / 3 * px - py / 3) / size_px
+        r = (2 / 3 * py) / size_px
+        s = -q - r
+        rq, rr, rs = np.rint(q), np.rint(r), np.rint(s)
+        dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+        fix_q = (dq > dr) & (dq > ds)
+        fix_r = ~fix_q & (dr > ds)
+        rq = np.where(fix_q, -rr - rs, rq)
+        rr = np.where(fix_r, -rq - rs, rr)
+        cell_q = rq.astype(np.int64)
+        cell_r = rr.astype(np.int64)
+
+        span = int(world / size_px) + 4
+        cell_id = (cell_q + span) * (2 * span + 1) + (cell_r + span)
+        cells, first, counts = np.unique(cell_id, return_index=True, return_counts=True)
+        # Tâm ô quy về lat/lng
+        cq, cr = cell_q[first], cell_r[first]
+        cx = size_px * np.sqrt(3) * (cq + cr / 2) / world
+        cy = size_px * 1.5 * cr / world
+        c_lng = cx * 360.0 - 180.0
+        c_lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * cy))))
+        cells = np.column_stack([np.round(c_lat, 5), np.round(c_lng, 5), counts])
+        levels.append({
+            "m": int(counts.max(initial=0)),
+            "c": [[la, lo, int(n)] for la, lo, n in cells.tolist()],
+        })
+        if counts.max(initial=0) <= 1:
+            break
+    return levels
+
+
+def build_hexbin_json(df, lat_col="latitude", lon_col="longitude", name_col="name"):
+    def build():
+        lat, lon, _ = _valid_points(df, lat_col, lon_col, name_col)
+        return _to_script_json(build_hexbin_index(lat, lon))
+
+    # Mỗi trạng thái bộ lọc tính một lần cho mọi mức zoom
+    return _memoize("hexbin", df, lat_col, lon_col, name_col, build)
+
+
+def clear_cache():
+    _payload_cache.clear()
+
+
+def build_layer_json(df, layer_id, label="", color=None, lat_col="latitude", lon_col="longitude", name_col="name",
+                     cluster=None, tiles=None, visible=True, hexbin=False):
+    # Ghép JSON một lớp bản đồ từ các payload đã nhớ, không tuần tự hoá lại danh sách điểm.
+    # hexbin: chỉ gửi các ô mật độ đã gộp, không gửi điểm
+    hexbin_json = "null"
+    if hexbin:
+        points_json, clusters_json, tiles = "[]", "null", None
+        hexbin_json = build_hexbin_json(df, lat_col=lat_col, lon_col=lon_col, name_col=name_col)
+    elif tiles is not None:
+        points_json, clusters_json = "[]", "null"
+    else:
+        if cluster is None:
+            cluster = len(df) >= CLUSTER_THRESHOLD
+        points_json = build_points_json(df, lat_col=lat_col, lon_col=lon_col, name_col=name_col)
+        clusters_json = build_cluster_json(df, lat_col=lat_col, lon_col=lon_col, name_col=name_col) if cluster else "null"
+    meta = _to_script_json({"id": layer_id, "label": label, "color": color, "visible": visible, "tiles": tiles})
+    return f'{meta[:-1]},"points":{points_json},"clusters":{clusters_json},"hexbin":{hexbin_json}}}'
+
+
+def render_map_layers(layers, api_key, map_id="", height=800, rows_in=None):
+    # layers: danh sách chuỗi từ build_layer_json; từ hai lớp trở lên iframe hiện ô bật/tắt lớp
+    if not os.path.exists(TEMPLATE_PATH):
+        st.error("❌ Không tìm thấy file map4d_template.html!")
+        return
+
+    with stage("map_html", rows_in=rows_in) as perf:
+        html_content = (
+            load_template()
+            .replace("__API_KEY__", api_key)
+            .replace("__MAP_ID__", map_id or "")
+            .replace("__HEIGHT__", str(height))
+            .replace("__HEX_SIZE__", str(HEXBIN_SIZE_PX))
+            .replace("##LAYERS_PLACEHOLDER##", "[" + ",".join(layers) + "]")
+        )
+        perf["bytes"] = len(html_content.encode("utf-8"))
+        st.components.v1.html(html_content, height=height)
+
+
+def render_map4d(df, api_key, map_id="", lat_col="latitude", lon_col="longitude", name_col="name", cluster=None, tiles=None,
+                 hexbin=False):
+    # tiles: nguồn tile tĩnh từ tile_export.tile_source(); khi có thì HTML không chứa điểm nào
+    layer = build_layer_json(df, "points", lat_col=lat_col, lon_col=lon_col, name_col=name_col, cluster=cluster, tiles=tiles,
+                             hexbin=hexbin)
+    render_map_layers([layer], api_key, map_id, rows_in=len(df))
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pandas as pd
+
+from data_loader import BASE_DIR, DATASETS, load_dataset
+
+# So sánh bộ nhớ giữa bảng đọc thẳng từ CSV (chuỗi kiểu object như pandas 2)
+# và bảng đã áp lược đồ kiểu trong ingest.py.
+# Chạy: python memory_report.py [banking retail ...]
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def _as_object_strings(df):
+    text_cols = [col for col in df.columns if pd.api.types.is_string_dtype(df[col].dtype)]
+    return df.astype({col: object for col in text_cols})
+
+
+def memory_report(names=("banking", "retail")):
+    rows = []
+    for name in names:
+        spec = DATASETS[name]
+        before = _as_object_strings(pd.read_csv(os.path.join(BASE_DIR, spec["file"]), **spec["read_csv"]))
+        after = load_dataset(name)
+        for col in after.columns:
+            rows.append({
+                "dataset": name,
+                "column": col,
+                "dtype_before": str(before[col].dtype) if col in before.columns else "",
+                "dtype_after": str(after[col].dtype),
+                "bytes_before": int(before[col].memory_usage(deep=True, index=False)) if col in before.columns else 0,
+                "bytes_after": int(after[col].memory_usage(deep=True, index=False)),
+            })
+        rows.append({
+            "dataset": name,
+            "column": "(tổng)",
+            "dtype_before": "",
+            "dtype_after": "",
+            "bytes_before": frame_bytes(before),
+            "bytes_after": frame_bytes(after),
+        })
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or ["banking", "retail"]
+    report = memory_report(names)
+    report["ratio"] = (report["bytes_before"] / report["bytes_after"]).round(1)
+    with pd.option_context("display.max_rows", None, "display.width", 160):
+        print(report.to_string(index=False))
@@ -0,0 +1,62 @@
+import streamlit as st
+from data_loader import load_dataset
+from instrumentation import stage
+from map4d import build_layer_json, map4d_credentials, render_map_layers
+from tile_export import TILE_LAYERS, tile_source
+
+# Các lớp của bản đồ tổng hợp: (dataset, nhãn, màu marker)
+LAYERS = [
+    ("powerplant", "Nhà máy điện", "#e4572e"),
+    ("banking", "Ngân hàng", "#2e86de"),
+    ("retail", "Bán lẻ", "#27ae60"),
+    ("industry", "Khu công nghiệp", "#8e44ad"),
+]
+
+# dataset -> (bảng, nguồn tile, JSON lớp): dựng lại chỉ khi có phiên bản dữ liệu mới
+# hoặc bản xuất tile thay đổi, nên rerun của trang không phải băm lại toàn bộ điểm
+_layer_cache = {}
+
+
+def layer_json(name, label, color, df):
+    tiles = tile_source(name, {})
+    cached = _layer_cache.get(name)
+    if cached is not None and cached[0] is df and cached[1] == tiles:
+        return cached[2]
+    lat_col, lon_col, name_col = TILE_LAYERS[name]["coords"]
+    layer = build_layer_json(
+        df, name, label=label, color=color,
+        lat_col=lat_col, lon_col=lon_col, name_col=name_col, tiles=tiles,
+    )
+    _layer_cache[name] = (df, tiles, layer)
+    return layer
+
+
+def main():
+    if __name__ == "__main__":
+        st.set_page_config(page_title="Bản đồ tổng hợp", layout="wide")
+
+    st.title("🗺️ Bản đồ tổng hợp")
+    st.caption("Bật/tắt từng lớp ngay trên bản đồ; đổi lớp không tải lại trang hay gửi lại dữ liệu điểm.")
+
+    api_key, map_id = map4d_credentials()
+    if not api_key:
+        st.warning("⚠️ Vui lòng cấu hình MAP4D_API_KEY trong phần Secrets của Streamlit")
+        return
+
+    layers = []
+    total = 0
+    with stage("layers") as perf:
+        for name, label, color in LAYERS:
+            try:
+                df = load_dataset(name)
+            except Exception as e:
+                st.error(f"❌ Lỗi khi đọc dữ liệu {label}: {e}")
+                continue
+            layers.append(layer_json(name, label, color, df))
+            total += len(df)
+        perf["rows_out"] = total
+
+    render_map_layers(layers, api_key, map_id, rows_in=total)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# Nhãn menu -> module trang; module chỉ được import khi trang được chọn lần đầu
+PAGES = {
+    "Nhà máy điện": "trade_map",
+    "Bán lẻ": "retail_map",
+    "Ngân hàng": "banking_map",
+    "Khu công nghiệp": "industry_map",
+    "Bản đồ tổng hợp": "overlay_map",
+    "So sánh theo vùng": "regional_stats",
+}
+
+_import_times = {}
+_lock = threading.Lock()
+
+
+def load_page(label):
+    module_name = PAGES[label]
+    module = sys.modules.get(module_name)
+    if module is None:
+        with _lock:
+            module = sys.modules.get(module_name)
+            if module is None:
+                start = time.perf_counter()
+                module = importlib.import_module(module_name)
+                _import_times[module_name] = time.perf_counter() - start
+    return module.main
+
+
+def import_times():
+    # Thời gian import (giây) của các trang đã nạp trong tiến trình này
+    return dict(_import_times)
+
+
+def profile_imports(modules=None):
+    # Đo chi phí import lạnh của từng module trong tiến trình riêng để không bị cache của nhau
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    modules = modules or ["streamlit"] + list(PAGES.values())
+    code = "import time, importlib; t = time.perf_counter(); importlib.import_module({!r}); print(time.perf_counter() - t)"
+    results = {}
+    for module_name in modules:
+        out = subprocess.run(
+            [sys.executable, "-c", code.format(module_name)],
+            cwd=base_dir, capture_output=True, text=True, check=True,
+        )
+        results[module_name] = float(out.stdout.strip().splitlines()[-1])
+    return results
+
+
+if __name__ == "__main__":
+    for module_name, seconds in profile_imports(sys.argv[1:] or None).items():
+        print(f"{module_name:15} {seconds * 1000:8.1f} ms")
@@ -0,0 +1,79 @@
+import numpy as np
+import pyarrow as pa
+import streamlit as st
+
+from frame_cache import IdentityLRU
+from instrumentation import stage
+
+PAGE_SIZES = [25, 50, 100, 200]
+NO_SORT = "(không sắp xếp)"
+
+# Số trang Arrow đã mã hoá giữ lại; mỗi trang chỉ vài chục đến vài trăm dòng
+PAGE_CACHE_SIZE = 64
+ORDER_CACHE_SIZE = 32
+
+_page_cache = IdentityLRU(PAGE_CACHE_SIZE, "table_page")
+_order_cache = IdentityLRU(ORDER_CACHE_SIZE, "table_sort")
+
+
+def sort_order(df, column, ascending=True):
+    # Thứ tự dòng sau khi sắp theo cột, tính một lần cho mỗi (bảng, cột, chiều)
+    if column is None:
+        return None
+    key = (column, ascending)
+    order = _order_cache.get(key, df)
+    if order is None:
+        values = df[column].reset_index(drop=True)
+        order = values.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+        _order_cache.put(key, order, df)
+    return order
+
+
+def page_table(df, page, page_size, columns=None, sort_by=None, ascending=True):
+    # Chỉ mã hoá Arrow phần dòng của trang đang xem; trang không đổi thì dùng lại bảng đã mã hoá
+    columns = tuple(columns) if columns else tuple(df.columns)
+    key = (page, page_size, columns, sort_by, ascending)
+    table = _page_cache.get(key, df)
+    if table is not None:
+        return table
+
+    start = page * page_size
+    order = sort_order(df, sort_by, ascending)
+    if order is None:
+        positions = np.arange(start, min(start + page_size, len(df)))
+    else:
+        positions = order[start:start + page_size]
+    table = pa.Table.from_pandas(df.iloc[positions][list(columns)], preserve_index=True)
+
+    return _page_cache.put(key, table, df)
+
+
+def render_paged_table(df, key, columns=None, page_size=50):
+    # Bảng phân trang: chọn cột, sắp xếp, kích thước trang; chỉ gửi trang hiện tại lên trình duyệt
+    all_columns = list(df.columns)
+    default_columns = list(columns) if columns else all_columns
+
+    selected_columns = st.multiselect("Cột hiển thị:", options=all_columns, default=default_columns, key=f"{key}_columns")
+    size_col, sort_col, dir_col, page_col = st.columns(4)
+    size = size_col.selectbox(
+        "Số dòng mỗi trang:", options=PAGE_SIZES,
+        index=PAGE_SIZES.index(page_size) if page_size in PAGE_SIZES else 0, key=f"{key}_page_size",
+    )
+    sort_by = sort_col.selectbox("Sắp xếp theo:", options=[NO_SORT] + all_columns, key=f"{key}_sort_by")
+    ascending = dir_col.selectbox("Chiều:", options=["Tăng dần", "Giảm dần"], key=f"{key}_sort_dir") == "Tăng dần"
+    page_count = max(1, -(-len(df) // size))
+    # Không đặt max_value: số trang đổi theo bộ lọc, giá trị cũ trong session_state có thể vượt quá
+    page = page_col.number_input(f"Trang (1-{page_count}):", min_value=1, value=1, step=1, key=f"{key}_page")
+    page = min(int(page), page_count)
+
+    with stage(f"table:{key}", rows_in=len(df)) as perf:
+        table = page_table(
+            df, page - 1, size,
+            columns=selected_columns or default_columns,
+            sort_by=None if sort_by == NO_SORT else sort_by,
+            ascending=ascending,
+        )
+        perf["rows_out"] = table.num_rows
+        perf["bytes"] = table.nbytes
+        st.dataframe(table)
+    st.caption(f"Trang {page}/{page_count} · {len(df)} dòng")
@@ -0,0 +1,164 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import data_loader
+import geocode
+import tile_export
+from aggregates import aggregate
+from data_loader import DATASETS, dataset_path, read_dataset
+from filter_index import get_filter_index
+from search_index import SEARCH_COLUMNS, get_search_index
+from spatial_index import get_spatial_index
+
+logger = logging.getLogger("trade_streamlit.refresh")
+
+# Chu kỳ kiểm tra file CSV (giây)
+REFRESH_INTERVAL = 2.0
+# File phải giữ nguyên mtime/kích thước qua chừng này lần kiểm tra liên tiếp mới được nạp,
+# để không đọc phải file đang được ghi dở
+SETTLE_CHECKS = 2
+# Số luồng dựng song song ở lượt khởi động. Dùng luồng thay vì tiến trình: bảng, snapshot
+# memory-map và chỉ mục phải nằm trong chính tiến trình phục vụ; phần nặng (đọc Arrow/CSV,
+# NumPy) nhả GIL nên các bảng độc lập vẫn chạy song song
+WARMUP_WORKERS = 4
+
+# Những gì các trang dựng từ mỗi bảng: cột lọc, các tổng hợp biểu đồ (chiều, cột giá trị)
+# và chỉ mục không gian. Dựng sẵn trước khi công bố để rerun đầu tiên sau khi đổi dữ liệu
+# không phải trả chi phí này.
+WARM_SPECS = {
+    "powerplant": {
+        "filters": ["type", "sub_type", "province"],
+        "aggregates": [(["type", "sub_type"], None), (["type"], None), (["type"], "capacity"),
+                       (["sub_type"], "capacity"), (["province"], "capacity")],
+        "spatial": False,
+    },
+    "banking": {
+        "filters": ["city", "bank"],
+        "aggregates": [(["bank", "type"], None), (["bank"], None)],
+        "spatial": True,
+    },
+    "retail": {
+        "filters": ["city", "retail_chain"],
+        "aggregates": [(["retail_chain", "type"], None), (["retail_chain"], None)],
+        "spatial": True,
+    },
+    "industry": {
+        "filters": ["city", "investor"],
+        "aggregates": [],
+        "spatial": False,
+    },
+}
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def warm_dataset(name, df):
+    spec = WARM_SPECS.get(name)
+    if spec is None:
+        return
+    get_filter_index(df, spec["filters"])
+    for dims, value in spec["aggregates"]:
+        aggregate(df, dims, value=value)
+    if spec["spatial"]:
+        get_spatial_index(df)
+    if name in SEARCH_COLUMNS:
+        get_search_index(df, SEARCH_COLUMNS[name])
+
+
+def dataset_stat(name):
+    # mtime/kích thước của file nguồn và của bản đã điền toạ độ (geocode.py): đổi một trong hai là nạp lại
+    stat = os.stat(dataset_path(name))
+    return (stat.st_mtime_ns, stat.st_size) + geocode.output_stat(name)
+
+
+def refresh_dataset(name):
+    # Đọc, chuẩn hoá, dựng chỉ mục rồi mới công bố: phiên đang xem vẫn dùng bản cũ tới lúc đó
+    path = dataset_path(name)
+    stat = os.stat(path)
+    df = read_dataset(name)
+    # Đã bật điền toạ độ (geocode.py): phục vụ bảng đã điền, dựng lại nếu file nguồn đổi.
+    # source là nhãn nội dung của chính bảng được công bố (gồm cả bản đã điền), không chỉ của file nguồn
+    df, source = geocode.apply_output(name, df, data_loader.source_hash(path))
+    # Lấy sau khi điền: bước này có thể ghi lại bản đã điền
+    stat_key = (stat.st_mtime_ns, stat.st_size) + geocode.output_stat(name)
+    warm_dataset(name, df)
+    if tile_export.has_export(name) and not tile_export.export_is_current(name, source):
+        tile_export.export_dataset(name, df=df, source=source)
+    version = data_loader.publish(name, df, stat_key, source)
+    logger.info("%s: công bố phiên bản %d (%d dòng)", name, version, len(df))
+    return version
+
+
+class DatasetRefresher(threading.Thread):
+    def __init__(self, names=None, interval=REFRESH_INTERVAL):
+        super().__init__(name="dataset-refresher", daemon=True)
+        self.names = list(names or DATASETS)
+        self.interval = interval
+        self._stop_event = threading.Event()
+        # tên -> (stat, số lần thấy liên tiếp) của thay đổi đang chờ ổn định
+        self._pending = {}
+        # tên -> stat của lần nạp lỗi; chỉ thử lại khi file đổi tiếp
+        self._failed = {}
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        self.warm_up()
+        while not self._stop_event.wait(self.interval):
+            for name in self.names:
+                self.check(name)
+
+    def warm_up(self):
+        # Lượt đầu: đọc, chuẩn hoá, dựng chỉ mục và tổng hợp mọi bảng cùng lúc; trang cần bảng nào
+        # chờ đúng bảng đó (data_loader.load_dataset) rồi nhận bản đã dựng sẵn
+        data_loader.begin_warmup(self.names)
+        with ThreadPoolExecutor(max_workers=WARMUP_WORKERS, thread_name_prefix="dataset-warmup") as pool:
+            list(pool.map(self._warm_up_one, self.names))
+
+    def _warm_up_one(self, name):
+        try:
+            self.check(name)
+        finally:
+            data_loader.end_warmup(name)
+
+    def check(self, name):
+        try:
+            stat_key = dataset_stat(name)
+        except FileNotFoundError:
+            return
+        published = data_loader.published_stat(name)
+        if stat_key == published or stat_key == self._failed.get(name):
+            return
+
+        # Lần nạp đầu tiên không cần chờ; các lần sau chờ file ổn định
+        if published is not None:
+            seen_key, seen = self._pending.get(name, (None, 0))
+            seen = seen + 1 if seen_key == stat_key else 1
+            self._pending[name] = (stat_key, seen)
+            if seen < SETTLE_CHECKS:
+                return
+        self._pending.pop(name, None)
+
+        try:
+            refresh_dataset(name)
+            self._failed.pop(name, None)
+        except Exception:
+            # Giữ phiên bản đang phục vụ; file hỏng không làm trang lỗi
+            self._failed[name] = stat_key
+            logger.exception("%s: không nạp được dữ liệu mới, giữ phiên bản cũ", name)
+
+
+def start_refresher(interval=REFRESH_INTERVAL):
+    # Một luồng cho cả tiến trình; gọi lại ở mỗi rerun là an toàn
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None or not _refresher.is_alive():
+            _refresher = DatasetRefresher(interval=interval)
+            # Đánh dấu trước khi luồng chạy để trang của lượt rerun này đã thấy trạng thái khởi động
+            data_loader.begin_warmup(_refresher.names)
+            _refresher.start()
+    return _refresher
@@ -0,0 +1,214 @@
+import numpy as np
+import pandas as pd
+
+from data_loader import dataset_source_hash, dataset_version, load_dataset
+from frame_cache import IdentityLRU
+from search_index import fold
+
+# Truy vấn liên bảng theo vùng: mỗi bảng được gộp một lần thành khối nhỏ theo khoá vùng
+# (vùng kinh tế, mã tỉnh/thành, quận/huyện), các truy vấn chỉ nối và cuộn các khối này.
+# Kết quả nhớ theo (truy vấn, tham số, phiên bản của mọi bảng tham gia).
+
+# Mức vùng: nhãn hiển thị -> cột khoá
+LEVELS = {
+    "Vùng kinh tế": "economic_zone",
+    "Tỉnh/thành": "city_code",
+    "Quận/huyện": "district_key",
+}
+DATASETS = ["powerplant", "banking", "retail", "industry"]
+# Các bảng có cột địa giới, dựng gazetteer mã tỉnh <-> tên tỉnh
+GAZETTEER_DATASETS = ["banking", "retail", "industry"]
+
+# Các chỉ số theo vùng của từng bảng: tên cột kết quả -> cột nguồn được cộng (None: đếm dòng)
+MEASURES = {
+    "powerplant": {"plants": None, "capacity_mw": "capacity"},
+    "banking": {"bank_branches": None},
+    "retail": {"retail_stores": None},
+    "industry": {"industrial_parks": None, "park_area_ha": "area_ha"},
+}
+# Hạ tầng tổng hợp của một vùng: tổng các chỉ số đếm này
+INFRASTRUCTURE = ["plants", "bank_branches", "retail_stores", "industrial_parks"]
+
+CUBE_CACHE_SIZE = 16
+RESULT_CACHE_SIZE = 64
+
+_cube_cache = IdentityLRU(CUBE_CACHE_SIZE, "regional")
+_result_cache = IdentityLRU(RESULT_CACHE_SIZE, "regional")
+
+
+def _versions(names):
+    # Phiên bản công bố + hash file: đổi khi refresher công bố bản mới hoặc file CSV đổi
+    return tuple((name, dataset_version(name), dataset_source_hash(name)) for name in names)
+
+
+def _blank_to_na(series):
+    values = series.astype("string").str.strip()
+    return values.mask(values == "")
+
+
+def _fold_values(series, normalize=fold):
+    # Chuẩn hoá trên tập giá trị khác nhau rồi trải lại theo mã, không xử lý chuỗi từng dòng
+    codes, uniques = pd.factorize(_blank_to_na(series))
+    folded = np.asarray([normalize(value) for value in uniques], dtype=object)
+    values = folded.take(codes) if len(folded) else np.full(len(codes), None, dtype=object)
+    values[codes < 0] = None
+    return pd.Series(values, index=series.index, dtype="string")
+
+
+def _strip_prefix(text, prefix):
+    # str.removeprefix cần Python 3.9; bản triển khai (deploy.yml) còn chạy 3.8
+    return text[len(prefix):] if text.startswith(prefix) else text
+
+
+def _province_key(names):
+    # "Tỉnh Đắk Lắk" / "Thành phố Hà Nội" / "Đắk Lắk" -> "dak lak"
+    return _fold_values(names, lambda name: _strip_prefix(_strip_prefix(fold(name), "tinh "), "thanh pho "))
+
+
+def _admin_keys(df):
+    # Khoá vùng chuẩn hoá cho bảng có cột địa giới: mã tỉnh số (mỗi bảng lưu một kiểu),
+    # quận/huyện kèm mã tỉnh (tên huyện trùng giữa các tỉnh), vùng kinh tế viết hoa thống nhất
+    city_code = pd.to_numeric(_blank_to_na(df["city_code"]), errors="coerce").astype("Int64")
+    district_key = city_code.astype("string") + ":" + _fold_values(df["district"])
+    return pd.DataFrame({
+        "economic_zone": _blank_to_na(df["economic_zone"]).str.upper(),
+        "city_code": city_code,
+        "district_key": district_key,
+        "city": _blank_to_na(df["city"]),
+        "district": _blank_to_na(df["district"]).str.replace(r"\s+", " ", regex=True),
+    }, index=df.index)
+
+
+def _gazetteer():
+    # Mã tỉnh -> tên tỉnh, vùng kinh tế; tên tỉnh bỏ dấu -> mã tỉnh. Dựng từ các bảng có địa giới
+    def build():
+        keys = pd.concat([_admin_keys(load_dataset(name)) for name in GAZETTEER_DATASETS], ignore_index=True)
+        keys = keys.dropna(subset=["city_code"])
+        by_code = keys.groupby("city_code").agg(
+            city=("city", lambda s: s.mode().iat[0] if s.notna().any() else None),
+            economic_zone=("economic_zone", lambda s: s.mode().iat[0] if s.notna().any() else None),
+        )
+        province = _province_key(keys["city"])
+        by_name = keys.assign(province=province).dropna(subset=["province"]) \
+            .groupby("province")["city_code"].agg(lambda s: s.mode().iat[0])
+        districts = keys.dropna(subset=["district_key"]).groupby("district_key")["district"] \
+            .agg(lambda s: s.mode().iat[0])
+        return by_code, by_name, districts
+
+    return _cube_cache.get_or_build(("gazetteer", _versions(GAZETTEER_DATASETS)), build)
+
+
+def _region_keys(name, df):
+    if name != "powerplant":
+        return _admin_keys(df)
+    # Nhà máy điện chỉ có tên tỉnh (có dòng ghi hai tỉnh: lấy tỉnh đầu): tra mã tỉnh qua gazetteer,
+    # vùng kinh tế theo mã tỉnh; không có cấp quận/huyện
+    by_code, by_name, _ = _gazetteer()
+    first = _blank_to_na(df["province"]).str.split(",").str[0]
+    city_code = _province_key(first).map(by_name).astype("Int64")
+    zone = city_code.map(by_code["economic_zone"]).astype("string")
+    return pd.DataFrame({
+        "economic_zone": zone,
+        "city_code": city_code,
+        "district_key": pd.Series(pd.NA, index=df.index, dtype="string"),
+    }, index=df.index)
+
+
+def _dataset_frame(name, df):
+    if name == "industry":
+        # Diện tích ghi dạng "135ha", "390 ha"
+        area = df["total_scale_area"].astype("string").str.replace(",", ".", regex=False) \
+            .str.extract(r"(\d+(?:\.\d+)?)", expand=False)
+        df = df.assign(area_ha=pd.to_numeric(area, errors="coerce").astype("float64"))
+    return df
+
+
+def region_cube(name, level):
+    # Khối của một bảng ở một mức vùng: một dòng mỗi vùng, các cột là chỉ số của MEASURES[name]
+    key_col = LEVELS.get(level, level)
+
+    def build():
+        df = _dataset_frame(name, load_dataset(name))
+        keys = _region_keys(name, df)[key_col]
+        grouped = df.groupby(keys.to_numpy(), dropna=True, sort=False)
+        cube = pd.DataFrame(index=pd.Index([], name=key_col))
+        for column, source in MEASURES[name].items():
+            cube[column] = grouped.size() if source is None else grouped[source].sum(min_count=1)
+        cube.index.name = key_col
+        return cube
+
+    # Khoá vùng của nhà máy điện tra qua gazetteer: khối phải dựng lại khi bảng gazetteer đổi
+    sources = [name] + GAZETTEER_DATASETS if name == "powerplant" else [name]
+    return _cube_cache.get_or_build(("cube", name, key_col, _versions(sources)), build)
+
+
+def _labels(key_col, index):
+    by_code, _, districts = _gazetteer()
+    if key_col == "city_code":
+        return pd.DataFrame({
+            "region": index.map(by_code["city"]),
+            "economic_zone": index.map(by_code["economic_zone"]),
+        }, index=index)
+    if key_col == "district_key":
+        codes = pd.to_numeric(index.str.split(":").str[0], errors="coerce")
+        return pd.DataFrame({
+            "region": index.map(districts),
+            "city": pd.Index(codes).map(by_code["city"]),
+        }, index=index)
+    return pd.DataFrame({"region": index}, index=index)
+
+
+def rollup(level):
+    # Bảng nối mọi bảng theo vùng: nhãn vùng + chỉ số của từng bảng (0 khi vùng không có dòng nào)
+    key_col = LEVELS.get(level, level)
+
+    def build():
+        cubes = [region_cube(name, key_col) for name in DATASETS]
+        joined = pd.concat(cubes, axis=1, join="outer")
+        counts = [col for col in joined.columns if col in INFRASTRUCTURE]
+        joined[counts] = joined[counts].fillna(0).astype(np.int64)
+        joined["infrastructure"] = joined[INFRASTRUCTURE].sum(axis=1)
+        result = pd.concat([_labels(key_col, joined.index), joined], axis=1)
+        return result.sort_values("infrastructure", ascending=False).reset_index(drop=True)
+
+    return _result_cache.get_or_build(("rollup", key_col, _versions(DATASETS)), build)
+
+
+def banks_per_park(level="Tỉnh/thành"):
+    # Số điểm ngân hàng trên mỗi khu công nghiệp, chỉ các vùng có KCN
+    key_col = LEVELS.get(level, level)
+
+    def build():
+        table = rollup(key_col)
+        table = table[table["industrial_parks"] > 0].copy()
+        table["branches_per_park"] = table["bank_branches"] / table["industrial_parks"]
+        return table.sort_values("branches_per_park", ascending=False).reset_index(drop=True)
+
+    return _result_cache.get_or_build(("banks_per_park", key_col, _versions(DATASETS)), build)
+
+
+def retail_vs_capacity(level="Tỉnh/thành"):
+    # Mật độ bán lẻ so với công suất điện tái tạo: số cửa hàng trên 100 MW, chỉ các vùng có nhà máy
+    key_col = LEVELS.get(level, level)
+
+    def build():
+        table = rollup(key_col)
+        table = table[table["capacity_mw"] > 0].copy()
+        table["stores_per_100mw"] = table["retail_stores"] / table["capacity_mw"] * 100
+        return table.sort_values("capacity_mw", ascending=False).reset_index(drop=True)
+
+    return _result_cache.get_or_build(("retail_vs_capacity", key_col, _versions(DATASETS)), build)
+
+
+def top_regions(level="Quận/huyện", n=20):
+    # N vùng có tổng hạ tầng (nhà máy + ngân hàng + bán lẻ + KCN) lớn nhất
+    key_col = LEVELS.get(level, level)
+    return _result_cache.get_or_build(
+        ("top", key_col, n, _versions(DATASETS)),
+        lambda: rollup(key_col).head(n).reset_index(drop=True),
+    )
+
+
+def clear_cache():
+    _cube_cache.clear()
+    _result_cache.clear()
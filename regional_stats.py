@@ -0,0 +1,82 @@
+import streamlit as st
+from charts import bar_figure, show_figure
+from instrumentation import stage
+from paged_table import render_paged_table
+from regional import INFRASTRUCTURE, LEVELS, banks_per_park, retail_vs_capacity, rollup, top_regions
+
+# Nhãn hiển thị của các chỉ số trong bảng nối
+MEASURE_LABELS = {
+    "plants": "Nhà máy điện",
+    "capacity_mw": "Công suất (MW)",
+    "bank_branches": "Điểm ngân hàng",
+    "retail_stores": "Cửa hàng bán lẻ",
+    "industrial_parks": "Khu công nghiệp",
+    "park_area_ha": "Diện tích KCN (ha)",
+    "infrastructure": "Tổng hạ tầng",
+}
+
+
+def main():
+    if __name__ == "__main__":
+        st.set_page_config(page_title="So sánh theo vùng", layout="wide")
+
+    st.title("📍 So sánh theo vùng")
+    st.caption("Nối các bảng theo vùng kinh tế, tỉnh/thành (city_code) và quận/huyện.")
+
+    st.sidebar.header("Tuỳ chọn so sánh")
+    level = st.sidebar.selectbox("Mức vùng:", options=list(LEVELS), index=1, key="regional_level")
+    top_n = st.sidebar.slider("Số vùng đứng đầu:", min_value=5, max_value=50, value=15, key="regional_top_n")
+    width = st.sidebar.slider("Chọn chiều rộng biểu đồ:", min_value=400, max_value=1200, value=900, key="regional_width")
+    height = st.sidebar.slider("Chọn chiều cao biểu đồ:", min_value=300, max_value=800, value=450, key="regional_height")
+
+    try:
+        with stage("regional_query") as perf:
+            table = rollup(level)
+            top = top_regions(level, top_n)
+            per_park = banks_per_park(level)
+            per_capacity = retail_vs_capacity(level)
+            perf["rows_out"] = len(table)
+    except Exception as e:
+        st.error(f"❌ Lỗi khi tổng hợp dữ liệu theo vùng: {e}")
+        return
+
+    st.markdown(f"### 🏗️ {top_n} vùng có tổng hạ tầng lớn nhất")
+    with stage("chart"):
+        long = top.melt(id_vars="region", value_vars=INFRASTRUCTURE, var_name="measure", value_name="count")
+        long["measure"] = long["measure"].map(MEASURE_LABELS)
+        fig = bar_figure(
+            long, x="region", y="count", color="measure",
+            labels={"region": "Vùng", "count": "Số lượng", "measure": "Loại hạ tầng"},
+            title="Tổng hạ tầng theo vùng",
+        )
+        show_figure(fig, width, height)
+
+    st.markdown("### 🏦 Điểm ngân hàng trên mỗi khu công nghiệp")
+    with stage("chart"):
+        fig = bar_figure(
+            per_park.head(top_n), x="region", y="branches_per_park",
+            labels={"region": "Vùng", "branches_per_park": "Điểm ngân hàng / KCN"},
+            title="Điểm ngân hàng trên mỗi khu công nghiệp",
+        )
+        show_figure(fig, width, height)
+
+    st.markdown("### 🛒 Mật độ bán lẻ so với công suất điện tái tạo")
+    if per_capacity.empty:
+        st.info("Mức quận/huyện không có dữ liệu công suất: nhà máy điện chỉ ghi tỉnh.")
+    else:
+        st.dataframe(
+            per_capacity[["region", "retail_stores", "capacity_mw", "stores_per_100mw"]],
+            hide_index=True,
+            column_config={
+                "region": "Vùng",
+                "retail_stores": MEASURE_LABELS["retail_stores"],
+                "capacity_mw": MEASURE_LABELS["capacity_mw"],
+                "stores_per_100mw": st.column_config.NumberColumn("Cửa hàng / 100 MW", format="%.2f"),
+            },
+        )
+
+    st.markdown("### 📋 Bảng nối theo vùng")
+    render_paged_table(table, key="regional_table")
+
+if __name__ == "__main__":
+    main()
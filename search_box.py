@@ -0,0 +1,47 @@
+import pandas as pd
+import streamlit as st
+
+from data_loader import load_dataset
+from instrumentation import stage
+from search_index import SEARCH_COLUMNS, fold, get_search_index
+
+# Nhãn bảng trong kết quả tìm kiếm (trùng nhãn trang ở menu)
+DATASET_LABELS = {
+    "powerplant": "Nhà máy điện",
+    "banking": "Ngân hàng",
+    "retail": "Bán lẻ",
+    "industry": "Khu công nghiệp",
+}
+SEARCH_LIMIT = 10
+
+
+def render_search_box():
+    # Ô tìm nhanh ở sidebar của mọi trang: tìm không dấu, gần đúng trên tên/địa chỉ/chủ đầu tư của mọi bảng
+    query = st.sidebar.text_input("🔎 Tìm nhanh (tên, địa chỉ, chủ đầu tư):", key="global_search")
+    if not fold(query):
+        return
+
+    with stage("search") as perf:
+        frames = []
+        for name, columns in SEARCH_COLUMNS.items():
+            try:
+                df = load_dataset(name)
+            except Exception as e:
+                st.sidebar.error(f"❌ Lỗi khi đọc dữ liệu {DATASET_LABELS[name]}: {e}")
+                continue
+            hits = get_search_index(df, columns).search(query, limit=SEARCH_LIMIT)
+            hits.insert(0, "dataset", DATASET_LABELS[name])
+            frames.append(hits)
+        results = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if len(results):
+            results = results.sort_values(["coverage", "score"], ascending=False, kind="stable").head(SEARCH_LIMIT)
+        perf["rows_out"] = len(results)
+
+    if not len(results):
+        st.sidebar.info("Không tìm thấy kết quả phù hợp")
+        return
+    st.sidebar.dataframe(
+        results[["dataset", "column", "value", "rows"]],
+        hide_index=True,
+        column_config={"dataset": "Bảng", "column": "Cột", "value": "Giá trị", "rows": "Số dòng"},
+    )
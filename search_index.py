@@ -0,0 +1,216 @@
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from frame_cache import IdentityLRU
+
+# Cột được đánh chỉ mục tìm kiếm của từng bảng
+SEARCH_COLUMNS = {
+    "powerplant": ["name"],
+    "banking": ["name", "address"],
+    "retail": ["name", "address"],
+    "industry": ["name", "address", "investor"],
+}
+
+# Tỉ lệ trigram của câu truy vấn tối thiểu phải có trong giá trị: < 1 cho phép gõ sai vài ký tự
+MIN_COVERAGE = 0.6
+
+INDEX_CACHE_SIZE = 16
+
+# Bảng mã ký tự sau khi bỏ dấu: 0 là hết chuỗi, 1 là khoảng trắng, rồi a-z, 0-9, còn lại chung một mã
+_END, _SPACE, _OTHER = 0, 1, 38
+_ALPHABET = 39
+_CHAR_CODES = np.full(128, _OTHER, dtype=np.int64)
+_CHAR_CODES[0] = _END
+_CHAR_CODES[ord(" ")] = _SPACE
+_CHAR_CODES[ord("a"):ord("z") + 1] = np.arange(2, 28)
+_CHAR_CODES[ord("0"):ord("9") + 1] = np.arange(28, 38)
+# Số chuỗi mã hoá mỗi lượt khi dựng: giới hạn bộ nhớ của ma trận ký tự
+_BUILD_CHUNK = 65536
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+
+def _fold_table():
+    # Chữ Latin có dấu (gồm tiếng Việt) -> chữ gốc; dấu rời (dạng NFD) bị bỏ
+    table = {code: None for code in range(0x0300, 0x0370)}
+    for code in list(range(0x00C0, 0x0250)) + list(range(0x1E00, 0x1F00)):
+        base = "".join(ch for ch in unicodedata.normalize("NFD", chr(code)) if not unicodedata.combining(ch))
+        if base != chr(code):
+            table[code] = base
+    table[ord("đ")] = "d"
+    table[ord("Đ")] = "d"
+    return table
+
+
+_FOLD_TABLE = _fold_table()
+
+_index_cache = IdentityLRU(INDEX_CACHE_SIZE, "search_index")
+
+
+def fold(text):
+    # "Thuỷ điện Đa Nhim" -> "thuy dien da nhim": bỏ dấu, thường hoá, gộp ký tự không phải chữ/số
+    return _NON_WORD.sub(" ", str(text).lower().translate(_FOLD_TABLE)).strip()
+
+
+def _padded(folded):
+    # Mỗi từ được đệm hai khoảng trắng hai bên: trigram đầu từ ("  t", " th") cho tìm theo tiền tố,
+    # trigram cuối từ ("n ", "n  ") phân biệt từ trọn vẹn với tiền tố của từ dài hơn
+    return "  " + folded.replace(" ", "  ") + "  "
+
+
+def _gram_ids(codes):
+    grams = (codes[:, :-2] * _ALPHABET + codes[:, 1:-1]) * _ALPHABET + codes[:, 2:]
+    # Bỏ trigram vượt quá cuối chuỗi
+    return grams, codes[:, 2:] != _END
+
+
+def _query_grams(query):
+    words = fold(query).split()
+    if not words:
+        return np.empty(0, dtype=np.int64)
+    text = _padded(" ".join(words))
+    if not query[-1:].isspace():
+        # Từ cuối đang gõ dở: chỉ dùng như tiền tố
+        text = text[:-2]
+    codes = np.array([ord(ch) for ch in text], dtype=np.int64)
+    codes = np.where(codes < 128, _CHAR_CODES[np.minimum(codes, 127)], _OTHER)
+    grams, valid = _gram_ids(codes[None, :])
+    return np.unique(grams[valid])
+
+
+class SearchIndex:
+    # Chỉ mục trigram trên các giá trị khác nhau (đã bỏ dấu) của những cột văn bản:
+    # danh sách đăng ký (posting) của mỗi trigram là các mã giá trị tăng dần, lưu liền trong một mảng.
+    # Truy vấn chỉ đọc posting của các trigram hiếm nhất để lấy ứng viên rồi đếm trigram khớp bằng
+    # tìm nhị phân, nên chi phí bám theo số ứng viên chứ không theo số dòng của bảng.
+    def __init__(self, df, columns):
+        self.df = df
+        self.columns = tuple(columns)
+        values, value_columns = [], []
+        orders, starts, value_rows = [], [], []
+        for i, col in enumerate(self.columns):
+            codes, uniques = pd.factorize(df[col])
+            codes = codes.astype(np.int64)
+            order = np.argsort(codes, kind="stable")
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            missing = int((codes < 0).sum())
+            # Mã giá trị chung của mọi cột = vị trí trong self.values; các dòng của một giá trị là
+            # dải [start, start + rows) trong self._order (order của mọi cột nối liền nhau)
+            base = len(df) * i
+            orders.append(order)
+            starts.append(base + missing + np.cumsum(counts) - counts)
+            value_rows.append(counts)
+            values.extend(uniques.astype(str))
+            value_columns.extend([i] * len(uniques))
+        self.values = np.asarray(values, dtype=object)
+        self.value_columns = np.asarray(value_columns, dtype=np.int8)
+        self._order = np.concatenate(orders) if orders else np.empty(0, dtype=np.int64)
+        self._starts = np.concatenate(starts) if starts else np.empty(0, dtype=np.int64)
+        self.value_rows = np.concatenate(value_rows) if value_rows else np.empty(0, dtype=np.int64)
+        self._build_postings()
+
+    def _build_postings(self):
+        # Chuẩn hoá theo giá trị khác nhau (không theo dòng), mã hoá ký tự theo lô bằng NumPy
+        n = len(self.values)
+        none = _ALPHABET ** 3
+        gram_parts, id_parts = [], []
+        for start in range(0, n, _BUILD_CHUNK):
+            chunk = [_padded(fold(value)) for value in self.values[start:start + _BUILD_CHUNK]]
+            text = np.array(chunk, dtype=str)
+            width = text.dtype.itemsize // 4
+            codes = text.view(np.uint32).reshape(len(chunk), width).astype(np.int64)
+            codes = np.where(codes < 128, _CHAR_CODES[np.minimum(codes, 127)], _OTHER)
+            grams, valid = _gram_ids(codes)
+            # Bỏ trigram lặp trong cùng một giá trị: sắp theo hàng rồi so với phần tử liền trước
+            grams = np.where(valid, grams, none)
+            grams.sort(axis=1)
+            keep = grams != none
+            keep[:, 1:] &= grams[:, 1:] != grams[:, :-1]
+            gram_parts.append(grams[keep].astype(np.uint16))
+            id_parts.append(np.nonzero(keep)[0].astype(np.int64) + start)
+        grams = np.concatenate(gram_parts) if gram_parts else np.empty(0, dtype=np.uint16)
+        ids = np.concatenate(id_parts) if id_parts else np.empty(0, dtype=np.int64)
+        # Các cặp đang theo thứ tự mã giá trị; sắp ổn định theo trigram (radix sort trên uint16)
+        # để posting của mỗi trigram liền nhau và mã giá trị tăng dần
+        order = np.argsort(grams, kind="stable")
+        self._postings = ids[order]
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(grams, minlength=none))])
+        self._value_grams = np.bincount(ids, minlength=n)
+
+    def _posting(self, gram):
+        return self._postings[self._offsets[gram]:self._offsets[gram + 1]]
+
+    def _match(self, query, min_coverage):
+        grams = _query_grams(query)
+        if not len(grams):
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        postings = sorted((self._posting(g) for g in grams), key=len)
+        need = max(1, int(np.ceil(min_coverage * len(grams))))
+        # Giá trị có ít nhất `need` trigram thì phải chứa một trong (số trigram - need + 1) trigram hiếm nhất
+        seeds = postings[:len(grams) - need + 1]
+        if len(seeds) == 1:
+            # Khớp đủ: ứng viên là posting hiếm nhất, đếm trigram khớp bằng tìm nhị phân
+            candidates = seeds[0]
+            matched = np.zeros(len(candidates), dtype=np.int64)
+            for posting in postings:
+                found = np.searchsorted(posting, candidates)
+                found[found == len(posting)] = 0
+                matched += posting[found] == candidates
+        else:
+            # Khớp gần đúng: ứng viên nhiều, đếm thẳng trên mọi posting (không cần sắp xếp)
+            counts = np.bincount(np.concatenate(postings), minlength=len(self.values))
+            candidates = np.flatnonzero(counts >= need)
+            matched = counts[candidates]
+        keep = matched >= need
+        candidates, matched = candidates[keep], matched[keep]
+        # Hệ số Dice: giữa các giá trị khớp cùng số trigram, ưu tiên giá trị ngắn gần bằng câu truy vấn
+        scores = 2.0 * matched / (len(grams) + self._value_grams[candidates])
+        return candidates, matched / len(grams), scores
+
+    def search(self, query, limit=20, min_coverage=MIN_COVERAGE, columns=None):
+        # Các giá trị khớp nhất: DataFrame [column, value, coverage, score, rows] xếp theo tỉ lệ trigram
+        # của truy vấn có trong giá trị (coverage) rồi theo hệ số Dice (score)
+        # Thử khớp đủ trước: ứng viên chỉ là posting của trigram hiếm nhất nên rất ít;
+        # chỉ khi không đủ kết quả mới mở rộng sang khớp gần đúng
+        for coverage in sorted({1.0, min_coverage}, reverse=True):
+            ids, covered, scores = self._match(query, coverage)
+            if columns is not None:
+                allowed = [self.columns.index(col) for col in columns]
+                keep = np.isin(self.value_columns[ids], allowed)
+                ids, covered, scores = ids[keep], covered[keep], scores[keep]
+            if len(ids) >= limit:
+                break
+        if len(ids) > limit:
+            # Ngưỡng coverage của phần đầu rồi mới sắp: không sắp toàn bộ khi có nhiều kết quả
+            cutoff = np.partition(covered, len(covered) - limit)[len(covered) - limit]
+            keep = covered >= cutoff
+            ids, covered, scores = ids[keep], covered[keep], scores[keep]
+        order = np.lexsort((ids, -scores, -covered))[:limit]
+        ids, covered, scores = ids[order], covered[order], scores[order]
+        return pd.DataFrame({
+            "column": np.asarray(self.columns, dtype=object)[self.value_columns[ids]],
+            "value": self.values[ids],
+            "coverage": covered,
+            "score": scores,
+            "rows": self.value_rows[ids],
+        })
+
+    def positions(self, query, min_coverage=1.0, columns=None):
+        # Vị trí (tăng dần) các dòng có ít nhất một cột khớp truy vấn; mặc định phải khớp đủ mọi trigram
+        ids, _, _ = self._match(query, min_coverage)
+        if columns is not None:
+            allowed = [i for i, col in enumerate(self.columns) if col in columns]
+            ids = ids[np.isin(self.value_columns[ids], allowed)]
+        lengths = self.value_rows[ids]
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        # Nối các dải của mọi giá trị khớp thành một mảng chỉ số trong self._order, không lặp theo giá trị
+        offsets = np.repeat(self._starts[ids] - (np.cumsum(lengths) - lengths), lengths)
+        return np.unique(self._order[np.arange(total, dtype=np.int64) + offsets])
+
+
+def get_search_index(df, columns):
+    return _index_cache.get_or_build(tuple(columns), lambda: SearchIndex(df, columns), frame=df)
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+
+from frame_cache import IdentityLRU
+from geocode import precise_rows
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG_LAT = np.pi * EARTH_RADIUS_KM / 180.0
+
+# Ô lưới ~5,5 km theo vĩ độ: đủ nhỏ để truy vấn bán kính vài km chỉ quét vài ô
+DEFAULT_CELL_DEG = 0.05
+
+INDEX_CACHE_SIZE = 16
+# Số kết quả nearest_frame giữ lại cho mỗi chỉ mục (mỗi kết quả ứng với một bảng điểm truy vấn và k)
+NEAREST_CACHE_SIZE = 16
+
+_index_cache = IdentityLRU(INDEX_CACHE_SIZE, "spatial_index")
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype="float64")) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class SpatialIndex:
+    # Lưới đều theo độ (kiểu geohash): điểm được sắp theo mã ô, mỗi truy vấn chỉ
+    # tìm nhị phân các dải ô giao với vùng cần tìm rồi lọc chính xác bằng haversine.
+    def __init__(self, lat, lon, cell_deg=DEFAULT_CELL_DEG):
+        lat = pd.to_numeric(pd.Series(lat), errors="coerce").to_numpy(dtype="float64")
+        lon = pd.to_numeric(pd.Series(lon), errors="coerce").to_numpy(dtype="float64")
+        valid = np.isfinite(lat) & np.isfinite(lon)
+        rows = np.flatnonzero(valid)
+
+        self.cell_deg = cell_deg
+        self.n_cols = int(np.ceil(360.0 / cell_deg)) + 1
+        cells = self._cell_id(lat[valid], lon[valid])
+        order = np.argsort(cells, kind="stable")
+        self.cells = cells[order]
+        self.rows = rows[order]
+        self.lat = lat[valid][order]
+        self.lon = lon[valid][order]
+        self._nearest = IdentityLRU(NEAREST_CACHE_SIZE, "nearest")
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _cell_xy(self, lat, lon):
+        x = np.floor((np.asarray(lon) + 180.0) / self.cell_deg).astype(np.int64)
+        y = np.floor((np.asarray(lat) + 90.0) / self.cell_deg).astype(np.int64)
+        return x, y
+
+    def _cell_id(self, lat, lon):
+        x, y = self._cell_xy(lat, lon)
+        return y * self.n_cols + x
+
+    def _candidates(self, south, west, north, east):
+        # Chỉ số (trong mảng đã sắp) của các điểm thuộc những ô giao với khung
+        # Kẹp khung vào lưới để các dải ô của những hàng liền nhau không chồng lên nhau
+        south, north = max(south, -90.0), min(north, 90.0)
+        west, east = max(west, -180.0), min(east, 180.0)
+        if south > north or west > east:
+            return np.empty(0, dtype=np.int64)
+        x0, y0 = self._cell_xy(south, west)
+        x1, y1 = self._cell_xy(north, east)
+        ys = np.arange(int(y0), int(y1) + 1, dtype=np.int64)
+        starts = np.searchsorted(self.cells, ys * self.n_cols + int(x0), side="left")
+        ends = np.searchsorted(self.cells, ys * self.n_cols + int(x1), side="right")
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        # Nối các dải [start, end) thành một mảng chỉ số liên tục
+        offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        return np.arange(total, dtype=np.int64) + offsets
+
+    def bbox(self, south, west, north, east):
+        idx = self._candidates(south, west, north, east)
+        inside = (
+            (self.lat[idx] >= south) & (self.lat[idx] <= north)
+            & (self.lon[idx] >= west) & (self.lon[idx] <= east)
+        )
+        return np.sort(self.rows[idx[inside]])
+
+    def within(self, lat, lon, radius_km):
+        # Trả về (vị trí dòng, khoảng cách km) sắp theo khoảng cách tăng dần
+        dlat = radius_km / KM_PER_DEG_LAT
+        dlon = radius_km / (KM_PER_DEG_LAT * max(np.cos(np.radians(min(abs(lat) + dlat, 89.9))), 1e-6))
+        idx = self._candidates(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+        dist = haversine_km(lat, lon, self.lat[idx], self.lon[idx])
+        keep = dist <= radius_km
+        idx, dist = idx[keep], dist[keep]
+        order = np.argsort(dist, kind="stable")
+        return self.rows[idx[order]], dist[order]
+
+    def nearest(self, lat, lon, k=1):
+        # Mở rộng bán kính theo cấp số nhân cho đến khi chắc chắn có đủ k điểm gần nhất
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        k = min(k, len(self))
+        radius = self.cell_deg * KM_PER_DEG_LAT
+        while True:
+            rows, dist = self.within(lat, lon, radius)
+            if len(rows) >= k or radius > np.pi * EARTH_RADIUS_KM:
+                return rows[:k], dist[:k]
+            radius *= 2
+
+    def nearest_many(self, lats, lons, k=1):
+        # Mảng (n, k) vị trí dòng và khoảng cách; thiếu điểm thì -1 / NaN
+        lats = np.asarray(lats, dtype="float64")
+        lons = np.asarray(lons, dtype="float64")
+        rows = np.full((len(lats), k), -1, dtype=np.int64)
+        dists = np.full((len(lats), k), np.nan)
+        for i, (lat, lon) in enumerate(zip(lats, lons)):
+            if not (np.isfinite(lat) and np.isfinite(lon)):
+                continue
+            r, d = self.nearest(lat, lon, k)
+            rows[i, :len(r)] = r
+            dists[i, :len(d)] = d
+        return rows, dists
+
+    def nearest_frame(self, df, lat_col="latitude", lon_col="longitude", k=1):
+        # nearest_many cho mọi dòng của bảng, nhớ theo đối tượng bảng: kết quả lọc từ FilterIndex.select()
+        # giữ nguyên giữa các lần rerun nên vòng tìm từng điểm chỉ chạy khi bộ lọc hoặc k đổi
+        return self._nearest.get_or_build(
+            (lat_col, lon_col, k), lambda: self.nearest_many(df[lat_col], df[lon_col], k), frame=df
+        )
+
+
+def get_spatial_index(df, lat_col="latitude", lon_col="longitude"):
+    def build():
+        # Toạ độ điền bằng tâm quận/huyện, tỉnh/thành không vào chỉ mục: khoảng cách tới chúng vô nghĩa
+        precise = precise_rows(df)
+        return SpatialIndex(df[lat_col].where(precise), df[lon_col].where(precise))
+
+    return _index_cache.get_or_build((lat_col, lon_col), build, frame=df)
@@ -0,0 +1,227 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from data_loader import BASE_DIR, dataset_source_hash
+from filter_index import ALL
+from geocode import served_dataset
+from map4d import build_cluster_index, mercator
+
+# Xuất điểm của từng lớp bản đồ thành tile GeoJSON tĩnh theo mức zoom và theo tổ hợp bộ lọc.
+# Streamlit phục vụ thư mục static/ khi bật server.enableStaticServing; bản đồ chỉ tải các tile
+# nằm trong khung nhìn thay vì nhận toàn bộ điểm nhúng trong HTML ở mỗi lần rerun.
+# Chạy: python tile_export.py [--datasets banking retail]
+
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+TILE_DIR = os.path.join(STATIC_DIR, "tiles")
+# Đường dẫn tương đối với trang chính để vẫn đúng khi app chạy sau baseUrlPath
+TILE_URL = "app/static/tiles"
+
+# Tăng khi đổi định dạng tile để bản xuất cũ tự bị bỏ qua
+EXPORT_VERSION = "2"
+# Mức zoom tile cao nhất: ở mức này tile chứa điểm gốc, zoom sâu hơn dùng lại tile của mức này
+TILE_MAX_ZOOM = 10
+
+# Cột toạ độ/tên và các cột lọc; mỗi tổ hợp giá trị lọc có một bộ tile riêng
+TILE_LAYERS = {
+    "powerplant": {"coords": ("lat", "lon", "name"), "facets": ["type", "province"]},
+    "banking": {"coords": ("latitude", "longitude", "name"), "facets": ["city", "bank"]},
+    "retail": {"coords": ("latitude", "longitude", "name"), "facets": ["city", "retail_chain"]},
+    "industry": {"coords": ("latitude", "longitude", "name"), "facets": ["city", "investor"]},
+}
+
+_manifest_cache = {}
+
+
+def partition_id(selections):
+    active = sorted(
+        (col, str(value))
+        for col, value in selections.items()
+        if value is not None and value != ALL
+    )
+    if not active:
+        return "all"
+    key = json.dumps(active, ensure_ascii=False).encode("utf-8")
+    return hashlib.blake2b(key, digest_size=8).hexdigest()
+
+
+def _partitions(df, facets):
+    # Mọi tổ hợp con của các cột lọc, kể cả không lọc: mỗi điểm xuất hiện 2^len(facets) lần
+    yield {}, np.arange(len(df))
+    for size in range(1, len(facets) + 1):
+        for combo in itertools.combinations(facets, size):
+            groups = df.groupby(list(combo), observed=True, sort=False).indices
+            for key, rows in groups.items():
+                key = key if isinstance(key, tuple) else (key,)
+                yield dict(zip(combo, key)), rows
+
+
+def _level_features(levels, zoom, max_zoom, lat, lon, names):
+    if zoom < min(len(levels), max_zoom):
+        level = levels[zoom]
+        clusters = np.asarray(level["c"], dtype=np.float64).reshape(-1, 3)
+        singles = np.asarray(level["p"], dtype=np.int64)
+        f_lat = np.concatenate([clusters[:, 0], lat[singles]])
+        f_lon = np.concatenate([clusters[:, 1], lon[singles]])
+        props = [{"n": int(n)} for n in clusters[:, 2]] + [{"name": name} for name in names[singles]]
+    else:
+        f_lat, f_lon = lat, lon
+        props = [{"name": name} for name in names]
+    return f_lat, f_lon, props
+
+
+def _write_json(path, obj):
+    payload = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(payload)
+    return len(payload)
+
+
+def _write_tiles(out_dir, lat, lon, names):
+    # Mức zoom < max_zoom: cụm và điểm lẻ của build_cluster_index; mức max_zoom luôn là điểm gốc,
+    # kể cả khi còn cụm (điểm trùng toạ độ không bao giờ tách nên build_cluster_index đủ mọi mức).
+    # Chỉ ghi tile có điểm, client coi tile thiếu (404) là rỗng.
+    levels = build_cluster_index(lat, lon)
+    max_zoom = min(len(levels), TILE_MAX_ZOOM)
+    files = size = 0
+    for zoom in range(max_zoom + 1):
+        f_lat, f_lon, props = _level_features(levels, zoom, max_zoom, lat, lon, names)
+        x, y = mercator(f_lat, f_lon)
+        tiles = 2 ** zoom
+        tile_x = (x * tiles).astype(np.int64)
+        tile_y = (y * tiles).astype(np.int64)
+        order = np.lexsort((tile_y, tile_x))
+        bounds = np.flatnonzero(np.diff(tile_x[order]) | np.diff(tile_y[order])) + 1
+        for chunk in np.split(order, bounds):
+            if not len(chunk):
+                continue
+            features = [
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": [round(float(f_lon[i]), 6), round(float(f_lat[i]), 6)]},
+                    "properties": props[i],
+                }
+                for i in chunk
+            ]
+            path = os.path.join(out_dir, str(zoom), str(tile_x[chunk[0]]), f"{tile_y[chunk[0]]}.json")
+            size += _write_json(path, {"type": "FeatureCollection", "features": features})
+            files += 1
+    return max_zoom, files, size
+
+
+def export_dataset(name, out_dir=TILE_DIR, df=None, source=None):
+    # df/source: bảng và nhãn nội dung khi xuất cho một phiên bản chưa công bố (refresher.py);
+    # chạy từ dòng lệnh thì xuất đúng bảng trang phục vụ, kể cả toạ độ đã điền (geocode.py)
+    layer = TILE_LAYERS[name]
+    lat_col, lon_col, name_col = layer["coords"]
+    if df is None:
+        df, source = served_dataset(name)
+    lat = pd.to_numeric(df[lat_col], errors="coerce").to_numpy(dtype="float64")
+    lon = pd.to_numeric(df[lon_col], errors="coerce").to_numpy(dtype="float64")
+    valid = ~(np.isnan(lat) | np.isnan(lon))
+    df = df[valid]
+    lat, lon = lat[valid], lon[valid]
+    names = df[name_col].fillna("").astype(str).to_numpy(dtype=object)
+
+    # Ghi vào thư mục tạm rồi đổi tên: phiên đang xem không bao giờ thấy bộ tile dở dang
+    target = os.path.join(out_dir, name)
+    tmp_dir = f"{target}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    partitions = {}
+    files = size = 0
+    for selection, rows in _partitions(df, layer["facets"]):
+        pid = partition_id(selection)
+        max_zoom, n_files, n_bytes = _write_tiles(os.path.join(tmp_dir, pid), lat[rows], lon[rows], names[rows])
+        partitions[pid] = {"max_zoom": max_zoom, "count": len(rows)}
+        files += n_files
+        size += n_bytes
+
+    manifest = {
+        "version": EXPORT_VERSION,
+        "source": source,
+        "facets": layer["facets"],
+        "partitions": partitions,
+    }
+    _write_json(os.path.join(tmp_dir, "manifest.json"), manifest)
+
+    old_dir = f"{target}.{os.getpid()}.old"
+    if os.path.exists(target):
+        os.replace(target, old_dir)
+    os.replace(tmp_dir, target)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return {"partitions": len(partitions), "files": files, "bytes": size}
+
+
+def _load_manifest(name, out_dir=TILE_DIR):
+    path = os.path.join(out_dir, name, "manifest.json")
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _manifest_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != EXPORT_VERSION:
+        manifest = None
+    _manifest_cache[path] = (mtime, manifest)
+    return manifest
+
+
+def has_export(name, out_dir=TILE_DIR):
+    return os.path.exists(os.path.join(out_dir, name, "manifest.json"))
+
+
+def export_is_current(name, source, out_dir=TILE_DIR):
+    # Bản xuất đã dựng từ đúng nội dung này (geocode.served_source): không cần xuất lại
+    manifest = _load_manifest(name, out_dir)
+    return manifest is not None and manifest["source"] == source
+
+
+def tile_source(name, selections):
+    # Nguồn tile cho trạng thái lọc hiện tại, hoặc None khi chưa bật phục vụ file tĩnh,
+    # chưa xuất, bản xuất đã cũ so với file dữ liệu, hoặc bộ lọc có cột không được tách tile.
+    # Khi None, bản đồ quay về nhúng điểm trực tiếp vào HTML.
+    if not st.get_option("server.enableStaticServing"):
+        return None
+    manifest = _load_manifest(name)
+    if manifest is None:
+        return None
+    source = dataset_source_hash(name)
+    if manifest["source"] != source:
+        return None
+    active = {col for col, value in selections.items() if value is not None and value != ALL}
+    if not active <= set(manifest["facets"]):
+        return None
+    pid = partition_id(selections)
+    partition = manifest["partitions"].get(pid)
+    if partition is None:
+        return None
+    # Tham số phiên bản để trình duyệt không dùng tile cũ từ cache HTTP sau khi xuất lại
+    return {"url": f"{TILE_URL}/{name}/{pid}", "max_zoom": partition["max_zoom"], "v": source[:12]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Xuất tile GeoJSON tĩnh cho các lớp bản đồ")
+    parser.add_argument("--datasets", nargs="+", choices=list(TILE_LAYERS), default=list(TILE_LAYERS))
+    parser.add_argument("--out", default=TILE_DIR)
+    args = parser.parse_args(argv)
+
+    for name in args.datasets:
+        stats = export_dataset(name, args.out)
+        print(f"{name:12} {stats['partitions']:6d} bộ lọc {stats['files']:8d} tile {stats['bytes'] / 1e6:8.2f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())